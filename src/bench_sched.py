@@ -0,0 +1,224 @@
+"""!
+@file bench_sched.py
+    This file contains micro-benchmarks of the cotask scheduler and the task_share queues. It measures
+    the cost of dispatching a task with @c Task.schedule(), of checking a task which isn't ready with
+    @c Task.ready(), of one pass of the schedulers over task sets of 1 to 64 tasks at 1 to 8 priority
+    levels, and of @c Queue.put() and @c Queue.get() with and without thread protection. Results are
+    printed as a table of nanoseconds per operation and operations per second and saved as JSON so
+    that runs can be compared to find regressions in the scheduler's hot path.
+
+    The scheduler is given a @c hal.VirtualClock so that which tasks are ready is the same on every
+    run; times are measured with the real clock. On a computer, run this file with Python. On the
+    board, run it from the REPL:
+    @code
+        import bench_sched
+        bench_sched.run()
+    @endcode
+
+@author Ben Elkayam
+@author Roey Mevorach
+@author Ermias Yemane
+
+@date   2026-Oct-17
+"""
+"""!
+@package gc                 Contains a garbage collector tool.
+@package json               Contains tools to save the results in a machine-readable form.
+@package hal                Contains the clocks used by the scheduler.
+@package cotask             Contains the class to run cooperatively scheduled tasks in a multitasking system.
+@package task_share         Contains the class that allows tasks to share data without the risk
+                            of data corruption by interrupts.
+"""
+import gc
+import json
+import hal
+import cotask
+import task_share
+
+## Numbers of tasks in the scaling benchmarks
+TASK_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+
+## Numbers of priority levels in the scaling benchmarks
+PRIORITY_LEVELS = (1, 2, 4, 8)
+
+
+def _idle_fun():
+    '''!
+    @brief      A task function which does nothing, so that only the scheduler's work is measured.
+    '''
+    while True:
+        yield 0
+
+
+def _measure(fun, count, real):
+    '''!
+    @brief      Time a number of calls to a function.
+    @param      fun The function to be called, with no arguments
+    @param      count The number of times to call the function
+    @param      real The clock with which the time is measured
+    @return     The average time per call in nanoseconds
+    '''
+    gc.collect()
+    start = real.ticks_us()
+    for _ in range(count):
+        fun()
+    elapsed = hal.ticks_diff(real.ticks_us(), start)
+    return elapsed * 1000.0 / count
+
+
+def _result(results, name, ns_per_op, **params):
+    '''!
+    @brief      Add one result to the list of results.
+    @param      results The list of results
+    @param      name The name of the benchmark
+    @param      ns_per_op The measured time per operation in nanoseconds
+    @param      params The settings for which the benchmark was run
+    '''
+    ops = 1e9 / ns_per_op if ns_per_op > 0 else 0.0
+    results.append({'name': name, 'params': params, 'ns_per_op': ns_per_op, 'ops_per_s': ops})
+
+
+def bench_task(results, clock, real, count, profile):
+    '''!
+    @brief      Measure the cost of dispatching a ready task and of checking a task which isn't ready.
+    @param      results The list to which results are added
+    @param      clock The virtual clock used by the scheduler
+    @param      real The clock with which times are measured
+    @param      count The number of times each operation is measured
+    @param      profile @c True to measure tasks which are being profiled
+    '''
+    # A 1 ms task whose clock is far ahead of it stays ready for one run per
+    # millisecond it is behind, so it is ready on every call
+    task = cotask.Task(_idle_fun, name='Bench', period=1, profile=profile)
+    clock.advance((count + 10) * 1000)
+    _result(results, 'schedule_ready', _measure(task.schedule, count, real), profile=profile)
+
+    # With the task caught up and the clock stopped, it is never ready
+    task._next_run = hal.ticks_add(clock.ticks_us(), 1000)
+    _result(results, 'ready_not_due', _measure(task.ready, count, real), profile=profile)
+
+
+def bench_scaling(results, clock, real, count):
+    '''!
+    @brief      Measure one pass of each scheduler over a set of tasks none of which is ready.
+    @details    This is the cost the scheduler adds to every pass through the main loop.
+    @param      results The list to which results are added
+    @param      clock The virtual clock used by the scheduler
+    @param      real The clock with which times are measured
+    @param      count The number of passes measured for each task set
+    '''
+    for levels in PRIORITY_LEVELS:
+        for tasks in TASK_COUNTS:
+            if levels > tasks:
+                continue
+            task_list = cotask.TaskList()
+            for num in range(tasks):
+                task_list.append(cotask.Task(_idle_fun, name='T' + str(num),
+                                             priority=num % levels, period=1000))
+            for sched in ('rr_sched', 'pri_sched', 'edf_sched'):
+                fun = getattr(task_list, sched)
+                _result(results, sched + '_idle', _measure(fun, count, real),
+                        tasks=tasks, levels=levels)
+            task_list = None
+
+
+def bench_queue(results, real, count):
+    '''!
+    @brief      Measure the cost of putting an item into a queue and getting it out again.
+    @param      results The list to which results are added
+    @param      real The clock with which times are measured
+    @param      count The number of items put and gotten
+    '''
+    for protect in (False, True):
+        queue = task_share.Queue('l', 16, thread_protect=protect, name='Bench')
+        _result(results, 'queue_put', _measure_put(queue, count, real), thread_protect=protect)
+        _result(results, 'queue_get', _measure_get(queue, count, real), thread_protect=protect)
+        task_share.share_list.remove(queue)
+
+
+def _measure_put(queue, count, real):
+    '''!
+    @brief      Time puts into a queue, emptying it without timing whenever it fills.
+    @param      queue The queue to be measured
+    @param      count The number of items to put
+    @param      real The clock with which times are measured
+    @return     The average time per put in nanoseconds
+    '''
+    queue.clear()
+    elapsed = 0
+    done = 0
+    while done < count:
+        start = real.ticks_us()
+        for _ in range(queue._size):
+            queue.put(1)
+        elapsed += hal.ticks_diff(real.ticks_us(), start)
+        done += queue._size
+        queue.clear()
+    return elapsed * 1000.0 / done
+
+
+def _measure_get(queue, count, real):
+    '''!
+    @brief      Time gets from a queue, filling it without timing whenever it empties.
+    @param      queue The queue to be measured
+    @param      count The number of items to get
+    @param      real The clock with which times are measured
+    @return     The average time per get in nanoseconds
+    '''
+    elapsed = 0
+    done = 0
+    while done < count:
+        queue.clear()
+        for _ in range(queue._size):
+            queue.put(1)
+        start = real.ticks_us()
+        for _ in range(queue._size):
+            queue.get()
+        elapsed += hal.ticks_diff(real.ticks_us(), start)
+        done += queue._size
+    return elapsed * 1000.0 / done
+
+
+def report(results):
+    '''!
+    @brief      Create a table of benchmark results.
+    @param      results The list of results
+    @return     A string containing the table
+    '''
+    ret_str = 'BENCHMARK          SETTINGS                      NS/OP        OPS/S\n'
+    for res in results:
+        params = ' '.join(key + '=' + str(res['params'][key]) for key in sorted(res['params']))
+        ret_str += f"{res['name']:<18s} {params:<24s}{res['ns_per_op']: 12.0f}{res['ops_per_s']: 13.0f}\n"
+    return ret_str
+
+
+def run(count=1000, out_file='bench_sched.json'):
+    '''!
+    @brief      Run all the benchmarks, print a table of results and save them as JSON.
+    @param      count The number of operations timed in each benchmark
+    @param      out_file The name of the file in which results are saved, or @c None to not save them
+    @return     The list of results, each a dictionary holding the benchmark's name, settings,
+                nanoseconds per operation and operations per second
+    '''
+    real = hal.clock
+    clock = hal.VirtualClock()
+    old_clock = hal.use(clock)
+    results = []
+    try:
+        bench_task(results, clock, real, count, False)
+        bench_task(results, clock, real, count, True)
+        bench_scaling(results, clock, real, count)
+        bench_queue(results, real, count)
+    finally:
+        hal.use(old_clock)
+
+    print(report(results))
+    if out_file is not None:
+        with open(out_file, 'w') as file:
+            json.dump({'platform': 'board' if hal.pyb is not None else 'host',
+                       'count': count, 'results': results}, file)
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -10,11 +10,15 @@
 @date   2023-Feb-10
 """
 """
+@package array              Contains the array type which holds the motor data without allocating memory.
 @package pyb                Contains all micro controller tools we use.
 @package utime              Contains tools for working with time-related operations.
+@package micropython        Contains the tool which reserves memory for reporting errors in interrupts.
 @package encoder_reader     Contains our encoder driver tools and data.
 @package motor_driver       Contains our motor driver tools and interfaces with the encoder.
 """
+import array
+import micropython
 import pyb, utime
 from pyb import Pin as Pin
 from encoder_reader import Encoder
@@ -35,7 +39,8 @@ class Controller:
         @brief      Create a controller object.
         @details    The constructor method initializes the Controller object with the given proportional gain kp,
                     target position setpoint, MotorDriver object motor, and Encoder object encoder. It also initializes
-                    the motor_data attribute as a tuple of (0,0), the time attribute as the current time in milliseconds,
+                    the motor_data attribute as an array of (0,0), which is updated in place by each run so that no
+                    memory is allocated in the control loop, the time attribute as the current time in milliseconds,
                     and prints a message indicating that the Controller object has been created with the given kp and setpoint.
         @param      self The object itself
         @param      kp Proportional gain
@@ -48,47 +53,110 @@ class Controller:
         self.setpoint = setpoint
         self.motor = motor
         self.encoder = encoder
-        self.motor_data = (0,0)
+        self.motor_data = array.array('l', (0, 0))
+        self._elapsed_us = 0
+        self._profile = None
+        self._profile_idx = 0
+        self._profile_base = 0
         self.time = utime.ticks_ms()
         print(f"Creating controller with KP {self.kp} and setpoint {self.setpoint}")
 
-    def run(self):
+    def run(self, dt_us=None):
         '''!
         @brief      Runs the controller.
         @details    Reads the encoder position, calculates the control output using a proportional control law,
-                    and sets the duty cycle of the motor. The method also updates the motor data and returns
-                    a flag indicating if the motor data has been updated.
+                    and sets the duty cycle of the motor. The method also updates the motor data in place and returns
+                    a flag indicating if the motor data has been updated. If the time since the last run is given,
+                    as it is by a task created with send_dt, the controller runs every time it is called and doesn't
+                    read the clock; otherwise it runs only when 10 ms have passed since its last run.
         @param      self The object itself
+        @param      dt_us The time in microseconds since the last run, or None for the controller to time itself
         @return     A flag indicating if the motor data has been updated (0 or 1).
         '''
-        ##Debugging flag
-        flag = 0
-        ## Time difference from which the motor runs its controller processes 
-        delta_time = utime.ticks_ms() - self.time
-        
-        #Loop handles motor updating its controller information
-        if delta_time >= 10:
-            self.encoder.read()
-            ## Is the value sent to the motor driver after being scaled by Kp
-            output = self.kp * (self.setpoint - self.encoder.position)
-            self.motor.set_duty_cycle(output)
-            
+        if dt_us is None:
+            ## Time difference from which the motor runs its controller processes 
+            delta_time = utime.ticks_ms() - self.time
+            if delta_time < 10:
+                return 0
             self.time = utime.ticks_ms()
-            self.motor_data = (delta_time + self.motor_data[0], self.encoder.position)
-            flag = 1
-        
-        return flag
+            dt_us = delta_time * 1000
+
+        if self._profile is not None:
+            self._next_setpoint()
+        self.encoder.update()
+        ## Is the value sent to the motor driver after being scaled by Kp
+        output = self.kp * (self.setpoint - self.encoder.position)
+        self.motor.set_duty_cycle(output)
+
+        self._add_time(dt_us)
+        self.motor_data[1] = self.encoder.position
+        return 1
+
+    def _add_time(self, dt_us):
+        '''!
+        @brief      Add the time of a run to the time kept in the motor data.
+        @details    The time is kept in milliseconds in the motor data, with the leftover microseconds carried to
+                    the next run so that no time is lost to rounding.
+        @param      self The object itself
+        @param      dt_us The time in microseconds since the last run
+        @return     None
+        '''
+        elapsed = self._elapsed_us + dt_us
+        ms = elapsed // 1000
+        self._elapsed_us = elapsed - ms * 1000
+        self.motor_data[0] += ms
 
     def set_setpoint(self, setpoint):
         """!
         @brief      Method to set the target position for the motor.
         @details    This method takes in a setpoint parameter and updates the target position of the motor.
+                    Any profile being followed is stopped.
         @param      self The object itself
         @param      setpoint Target position for the motor
         @return     None
         """
+        self._profile = None
         self.setpoint = setpoint
 
+    def follow(self, profile, start=None):
+        '''!
+        @brief      Move the motor along a precomputed motion profile.
+        @details    Each run of the controller takes the next position in the profile, added to the starting
+                    position, as its setpoint; when the profile ends the setpoint stays at its last position.
+                    Looking up a setpoint is one index and one add, so following a profile costs the control
+                    loop almost nothing. The profile should have been made, for example by the trajectory
+                    module, with the period at which this controller runs.
+        @param      self The object itself
+        @param      profile An array of positions relative to the start of the move, one for each run
+        @param      start The position from which the move starts, or None to start from the present setpoint
+        @return     None
+        '''
+        self._profile_base = self.setpoint if start is None else start
+        self._profile_idx = 0
+        self._profile = profile
+
+    def moving(self):
+        '''!
+        @brief      Check if the controller is following a profile.
+        @param      self The object itself
+        @return     True if a profile is being followed, False once it has ended
+        '''
+        return self._profile is not None
+
+    def _next_setpoint(self):
+        '''!
+        @brief      Set the setpoint to the next position in the profile being followed.
+        @param      self The object itself
+        @return     None
+        '''
+        profile = self._profile
+        idx = self._profile_idx
+        self.setpoint = self._profile_base + profile[idx]
+        idx += 1
+        if idx >= len(profile):
+            self._profile = None
+        self._profile_idx = idx
+
     def set_kp(self, kp):
         '''!
         @brief      Set the proportional gain.
@@ -97,4 +165,523 @@ class Controller:
         @param      kp Proportional gain
         @return     None
         '''
-        self.kp = kp
\ No newline at end of file
+        self.kp = kp
+
+
+class FixedPIDController(Controller):
+    '''!
+    @brief      A fixed-point PID controller with output saturation and anti-windup.
+    @details    The FixedPIDController class is a drop-in replacement for Controller which adds integral
+                and derivative terms and limits its output to the motor driver's range. The gains are
+                multiplied by 2 to the power @c shift and rounded to integers when they are set, with
+                the sample period folded into the integral and derivative gains, so each run does only
+                integer multiplies, adds and shifts; no float objects are made in the control loop.
+                The derivative acts on the measured position rather than the error, so a change of
+                setpoint doesn't kick the motor. The integral is frozen while the output is saturated
+                in the direction the error pushes it, and is clamped to the output range, so it can't
+                wind up while the motor is at its limit. The output is rounded to the nearest whole
+                percent, so errors of either sign are treated alike. Each product of a scaled gain
+                and an error must stay below 2 ** 30 to remain a small integer; with the default
+                shift of 16 this holds for any gain times error under 16384. When the time since the
+                last run is given to run(), the integral and derivative products are also multiplied
+                by 256 times the ratio of that time to the period (the integral) or its inverse (the
+                derivative) before being shifted back with rounding, so those products must stay
+                below 2 ** 22 divided by that ratio.
+    '''
+
+    def __init__(self, kp, ki, kd, setpoint, motor, encoder, period=10, shift=16, limit=100):
+        '''!
+        @brief      Create a fixed-point PID controller object.
+        @param      self The object itself
+        @param      kp Proportional gain in percent duty cycle per encoder count
+        @param      ki Integral gain in percent duty cycle per encoder count per second
+        @param      kd Derivative gain in percent duty cycle per encoder count per second of speed
+        @param      setpoint Target position for the motor
+        @param      motor MotorDriver object
+        @param      encoder Encoder object
+        @param      period The time between runs of the control law in milliseconds
+        @param      shift The number of fraction bits in the scaled gains
+        @param      limit The largest duty cycle, in percent, sent to the motor
+        @return     None
+        '''
+        ## The time between runs of the control law in milliseconds
+        self.period = period
+        # The period in whole microseconds, used by the control law so that
+        # periods which aren't whole milliseconds are kept accurately
+        self._period_us = int(round(period * 1000))
+        ## The number of fraction bits in the scaled gains
+        self.shift = shift
+        ## The largest duty cycle, in percent, sent to the motor
+        self.limit = limit
+        ## The most recent duty cycle sent to the motor
+        self.output = 0
+        self._integral = 0
+        self._last_position = encoder.position
+        self.set_gains(kp, ki, kd)
+        super().__init__(kp, setpoint, motor, encoder)
+
+    def set_gains(self, kp, ki=None, kd=None):
+        '''!
+        @brief      Set the gains of the controller.
+        @details    The gains are scaled to integers here, so this should not be called in the control loop.
+        @param      self The object itself
+        @param      kp Proportional gain in percent duty cycle per encoder count
+        @param      ki Integral gain, or None to keep the present one
+        @param      kd Derivative gain, or None to keep the present one
+        @return     None
+        '''
+        scale = 1 << self.shift
+        self.kp = kp
+        if ki is not None:
+            self.ki = ki
+        if kd is not None:
+            self.kd = kd
+        self._kp = int(round(self.kp * scale))
+        self._ki = int(round(self.ki * self._period_us / 1000000 * scale))
+        self._kd = int(round(self.kd * 1000000 / self._period_us * scale))
+        self._integral_limit = self.limit << self.shift
+        self._round = (1 << self.shift) >> 1
+
+    def set_kp(self, kp):
+        '''!
+        @brief      Set the proportional gain.
+        @param      self The object itself
+        @param      kp Proportional gain
+        @return     None
+        '''
+        self.set_gains(kp)
+
+    def reset(self):
+        '''!
+        @brief      Clear the integral and derivative history, for example after the motor has been moved by hand.
+        @param      self The object itself
+        @return     None
+        '''
+        self._integral = 0
+        self._last_position = self.encoder.position
+
+    def run(self, dt_us=None):
+        '''!
+        @brief      Runs the controller.
+        @details    Once every period, reads the encoder position, calculates the control output with the
+                    integer PID law, limits it to the output range and sets the duty cycle of the motor. If the
+                    time since the last run is given, the controller runs every time it is called without
+                    reading the clock, and the integral and derivative terms are scaled by that time.
+        @param      self The object itself
+        @param      dt_us The time in microseconds since the last run, or None for the controller to time itself
+        @return     A flag indicating if the motor data has been updated (0 or 1).
+        '''
+        if dt_us is None:
+            now = utime.ticks_ms()
+            delta_time = utime.ticks_diff(now, self.time)
+            if delta_time < self.period:
+                return 0
+            self.time = now
+            self._step()
+            self._add_time(delta_time * 1000)
+        else:
+            self._step(dt_us)
+            self._add_time(dt_us)
+        return 1
+
+    def _step(self, dt_us=0):
+        '''!
+        @brief      Reads the encoder, calculates the output with the integer PID law and sets the duty cycle.
+        @details    If the time since the last run is given, the integral and derivative terms are scaled by
+                    its ratio to the period, kept to 8 fraction bits, so the gains mean the same whatever the
+                    time between runs; otherwise they're used exactly as they are. This allocates no memory, so it may be called from an interrupt service routine.
+        @param      self The object itself
+        @param      dt_us The time in microseconds since the last run, or 0 if it was one period
+        @return     None
+        '''
+        if self._profile is not None:
+            self._next_setpoint()
+        self.encoder.update()
+        position = self.encoder.position
+        error = self.setpoint - position
+        i_term = self._ki * error
+        d_term = self._kd * (position - self._last_position)
+        if dt_us > 0:
+            period_us = self._period_us
+            i_term = (i_term * ((dt_us << 8) // period_us) + 128) >> 8
+            d_term = (d_term * ((period_us << 8) // dt_us) + 128) >> 8
+        integral = self._integral + i_term
+        if integral > self._integral_limit:
+            integral = self._integral_limit
+        elif integral < -self._integral_limit:
+            integral = -self._integral_limit
+
+        output = (self._kp * error + integral - d_term + self._round) >> self.shift
+        # Don't integrate while saturated in the direction the error pushes
+        if output > self.limit:
+            output = self.limit
+            if error > 0:
+                integral = self._integral
+        elif output < -self.limit:
+            output = -self.limit
+            if error < 0:
+                integral = self._integral
+
+        self._integral = integral
+        self._last_position = position
+        self.output = output
+        self.motor.set_duty_cycle(output)
+        self.motor_data[1] = position
+
+
+class ISRController(FixedPIDController):
+    '''!
+    @brief      A fixed-point PID controller run by a hardware timer interrupt.
+    @details    The ISRController class runs the same integer control law as FixedPIDController, but from
+                the callback of a hardware timer rather than from a cooperative task, so each run happens
+                within microseconds of its due time no matter what the scheduler is doing. All of the
+                controller's state is made before the timer is started and the callback allocates no
+                memory, as MicroPython doesn't allow allocation in an interrupt. If a queue is given, the
+                position measured in each run is put into it, dropping the sample if the queue is full,
+                so that slower tasks can log or send the data; samples are one period apart.
+                @code
+                    positions = task_share.SPSCQueue('l', 100, name="Positions")
+                    controller = ISRController(0.05, 0.5, 0.001, 5000, motor1, encoder1, timer=6,
+                                               freq=100, queue=positions)
+                    controller.start()
+                @endcode
+    '''
+
+    def __init__(self, kp, ki, kd, setpoint, motor, encoder, timer, freq=100, queue=None, shift=16, limit=100):
+        '''!
+        @brief      Create an interrupt driven controller object. The controller doesn't run until start is called.
+        @param      self The object itself
+        @param      kp Proportional gain in percent duty cycle per encoder count
+        @param      ki Integral gain in percent duty cycle per encoder count per second
+        @param      kd Derivative gain in percent duty cycle per encoder count per second of speed
+        @param      setpoint Target position for the motor
+        @param      motor MotorDriver object
+        @param      encoder Encoder object
+        @param      timer The number of a hardware timer not used by the motors or encoders
+        @param      freq The number of times per second the controller runs, from 1 to 1000; a
+                    ValueError is raised for other rates
+        @param      queue A queue, such as a task_share.SPSCQueue, into which positions are put, or None
+        @param      shift The number of fraction bits in the scaled gains
+        @param      limit The largest duty cycle, in percent, sent to the motor
+        @return     None
+        '''
+        if not 0 < freq <= 1000:
+            raise ValueError('ISRController freq must be from 1 to 1000 Hz, not ' + str(freq))
+        super().__init__(kp, ki, kd, setpoint, motor, encoder, 1000 / freq, shift, limit)
+        micropython.alloc_emergency_exception_buf(100)
+        ## The queue into which positions are put, or None
+        self.queue = queue
+        self.timer = pyb.Timer(timer, freq=freq)
+        # Make the bound method once; making it in the interrupt would allocate memory
+        self._callback = self._isr
+
+    def start(self):
+        '''!
+        @brief      Start running the controller from the timer interrupt.
+        @param      self The object itself
+        @return     None
+        '''
+        self.reset()
+        self.timer.callback(self._callback)
+
+    def stop(self):
+        '''!
+        @brief      Stop running the controller and turn off the motor.
+        @param      self The object itself
+        @return     None
+        '''
+        self.timer.callback(None)
+        self.motor.set_duty_cycle(0)
+
+    def run(self, dt_us=None):
+        '''!
+        @brief      Does nothing, as the controller is run by the timer; kept so an ISRController can be used
+                    where a Controller is expected.
+        @param      self The object itself
+        @param      dt_us Ignored, as the timer sets the time between runs
+        @return     0, as the motor data is updated by the interrupt rather than by this method
+        '''
+        return 0
+
+    def _isr(self, timer):
+        '''!
+        @brief      The timer callback, which runs the control law once and puts the position into the queue.
+        @param      self The object itself
+        @param      timer The timer which caused the interrupt
+        @return     None
+        '''
+        self._step()
+        self._add_time(self._period_us)
+        if self.queue is not None:
+            self.queue.put(self.motor_data[1], True)     # in_ISR
+
+
+class ControllerBank:
+    '''!
+    @brief      Fixed-point PID control of several motors in one pass.
+    @details    The ControllerBank class keeps the gains, setpoints, positions and outputs of all of its
+                axes in parallel arrays and updates every axis in one loop each time it runs, so one task
+                can control any number of motors. The control law for each axis is the same integer PID
+                law as FixedPIDController's, with saturation, anti-windup, derivative on measurement,
+                rounding of the output and the same limits on the size of its products; a bank with
+                integral and derivative gains of zero is a proportional controller like
+                Controller, but with its output limited to the motor driver's range.
+    '''
+
+    def __init__(self, motors, encoders, kp, setpoints, ki=0, kd=0, period=10, shift=16, limit=100):
+        '''!
+        @brief      Create a controller bank object.
+        @param      self The object itself
+        @param      motors A list of MotorDriver objects, one for each axis
+        @param      encoders A list of Encoder objects in the same order as the motors
+        @param      kp Proportional gain in percent duty cycle per encoder count, either one number for every
+                    axis or a list with one for each axis
+        @param      setpoints A list of target positions, one for each axis
+        @param      ki Integral gain in percent duty cycle per encoder count per second, one or a list
+        @param      kd Derivative gain in percent duty cycle per encoder count per second of speed, one or a list
+        @param      period The time between runs of the control law in milliseconds
+        @param      shift The number of fraction bits in the scaled gains
+        @param      limit The largest duty cycle, in percent, sent to each motor
+        @return     None
+        '''
+        ## The number of axes controlled
+        self.count = len(motors)
+        self.motors = list(motors)
+        self.encoders = list(encoders)
+        ## The time between runs of the control law in milliseconds
+        self.period = period
+        # The period in whole microseconds, so that the control law only does integer math
+        self._period_us = int(round(period * 1000))
+        ## The number of fraction bits in the scaled gains
+        self.shift = shift
+        ## The largest duty cycle, in percent, sent to each motor
+        self.limit = limit
+        self._integral_limit = limit << shift
+        self._round = (1 << shift) >> 1
+
+        zeros = [0] * self.count
+        self._kp = array.array('l', zeros)
+        self._ki = array.array('l', zeros)
+        self._kd = array.array('l', zeros)
+        self._integrals = array.array('l', zeros)
+        self._last_positions = array.array('l', zeros)
+        ## The target position of each axis
+        self.setpoints = array.array('l', setpoints)
+        ## The most recently measured position of each axis
+        self.positions = array.array('l', zeros)
+        ## The most recent duty cycle sent to each motor
+        self.outputs = array.array('l', zeros)
+        ## The total time in milliseconds over which the bank has run
+        self.elapsed = 0
+        self._elapsed_us = 0
+        self._profiles = [None] * self.count
+        self._profile_idx = array.array('l', zeros)
+        self._profile_base = array.array('l', zeros)
+
+        for axis in range(self.count):
+            self.set_gains(axis, self._pick(kp, axis), self._pick(ki, axis), self._pick(kd, axis))
+        self.reset()
+        self.time = utime.ticks_ms()
+        print(f"Creating controller bank of {self.count} axes")
+
+    @staticmethod
+    def _pick(value, axis):
+        '''!
+        @brief      Get the value for one axis from a number given for all axes or a list of numbers.
+        @param      value A number or a list with one number for each axis
+        @param      axis The index of the axis
+        @return     The value for the axis
+        '''
+        return value[axis] if isinstance(value, (list, tuple)) else value
+
+    def set_gains(self, axis, kp, ki=0, kd=0):
+        '''!
+        @brief      Set the gains of one axis.
+        @details    The gains are scaled to integers here, so this should not be called in the control loop.
+        @param      self The object itself
+        @param      axis The index of the axis
+        @param      kp Proportional gain in percent duty cycle per encoder count
+        @param      ki Integral gain in percent duty cycle per encoder count per second
+        @param      kd Derivative gain in percent duty cycle per encoder count per second of speed
+        @return     None
+        '''
+        scale = 1 << self.shift
+        self._kp[axis] = int(round(kp * scale))
+        self._ki[axis] = int(round(ki * self._period_us / 1000000 * scale))
+        self._kd[axis] = int(round(kd * 1000000 / self._period_us * scale))
+
+    def set_setpoint(self, axis, setpoint):
+        '''!
+        @brief      Set the target position of one axis.
+        @param      self The object itself
+        @param      axis The index of the axis
+        @param      setpoint Target position for the motor
+        @return     None
+        '''
+        self._profiles[axis] = None
+        self.setpoints[axis] = setpoint
+
+    def follow(self, axis, profile, start=None):
+        '''!
+        @brief      Move one axis along a precomputed motion profile.
+        @details    Each run of the bank takes the next position in the profile, added to the starting
+                    position, as the axis's setpoint, as Controller.follow does.
+        @param      self The object itself
+        @param      axis The index of the axis
+        @param      profile An array of positions relative to the start of the move, one for each run
+        @param      start The position from which the move starts, or None to start from the present setpoint
+        @return     None
+        '''
+        self._profile_base[axis] = self.setpoints[axis] if start is None else start
+        self._profile_idx[axis] = 0
+        self._profiles[axis] = profile
+
+    def move(self, profiles):
+        '''!
+        @brief      Start moving several axes along profiles at the same run, such as those made by
+                    trajectory.coordinated, so that the axes move together.
+        @param      self The object itself
+        @param      profiles A list with a profile, or None to leave the axis alone, for each axis
+        @return     None
+        '''
+        for axis in range(len(profiles)):
+            if profiles[axis] is not None:
+                self.follow(axis, profiles[axis])
+
+    def moving(self):
+        '''!
+        @brief      Check if any axis is following a profile.
+        @param      self The object itself
+        @return     True if a profile is being followed, False once all of them have ended
+        '''
+        for profile in self._profiles:
+            if profile is not None:
+                return True
+        return False
+
+    def reset(self):
+        '''!
+        @brief      Clear the integral and derivative history of every axis.
+        @param      self The object itself
+        @return     None
+        '''
+        for axis in range(self.count):
+            self._integrals[axis] = 0
+            self._last_positions[axis] = self.encoders[axis].position
+
+    def stop(self):
+        '''!
+        @brief      Turn off every motor.
+        @param      self The object itself
+        @return     None
+        '''
+        for motor in self.motors:
+            motor.set_duty_cycle(0)
+
+    def run(self, dt_us=None):
+        '''!
+        @brief      Runs the controller for every axis once each period.
+        @details    If the time since the last run is given, as it is by a task created with send_dt, the bank
+                    runs every time it is called without reading the clock, and the integral and derivative
+                    terms are scaled by that time as FixedPIDController's are.
+        @param      self The object itself
+        @param      dt_us The time in microseconds since the last run, or None for the bank to time itself
+        @return     A flag indicating if the positions and outputs have been updated (0 or 1).
+        '''
+        if dt_us is None:
+            now = utime.ticks_ms()
+            delta_time = utime.ticks_diff(now, self.time)
+            if delta_time < self.period:
+                return 0
+            self.time = now
+            self._step(0)
+            dt_us = delta_time * 1000
+        else:
+            self._step(dt_us)
+
+        elapsed = self._elapsed_us + dt_us
+        ms = elapsed // 1000
+        self._elapsed_us = elapsed - ms * 1000
+        self.elapsed += ms
+        return 1
+
+    def _step(self, dt_us):
+        '''!
+        @brief      Reads every encoder, calculates each output with the integer PID law and sets the duty cycles.
+        @details    The arrays are looked up once and kept in local variables so the loop over the axes does
+                    no attribute lookups on the bank. No memory is allocated.
+        @param      self The object itself
+        @param      dt_us The time in microseconds since the last run, or 0 if it was one period
+        @return     None
+        '''
+        encoders = self.encoders
+        motors = self.motors
+        kps = self._kp
+        kis = self._ki
+        kds = self._kd
+        integrals = self._integrals
+        last_positions = self._last_positions
+        setpoints = self.setpoints
+        positions = self.positions
+        outputs = self.outputs
+        profiles = self._profiles
+        profile_idx = self._profile_idx
+        profile_base = self._profile_base
+        shift = self.shift
+        half = self._round
+        limit = self.limit
+        integral_limit = self._integral_limit
+
+        # The integral and derivative terms are scaled by the time since the
+        # last run as a fraction of the period, with 8 fraction bits, when
+        # that time is given
+        scaled = dt_us > 0
+        i_scale = 256
+        d_scale = 256
+        if scaled:
+            period_us = self._period_us
+            i_scale = (dt_us << 8) // period_us
+            d_scale = (period_us << 8) // dt_us
+
+        for axis in range(self.count):
+            profile = profiles[axis]
+            if profile is not None:
+                idx = profile_idx[axis]
+                setpoints[axis] = profile_base[axis] + profile[idx]
+                idx += 1
+                if idx >= len(profile):
+                    profiles[axis] = None
+                profile_idx[axis] = idx
+
+            encoder = encoders[axis]
+            encoder.update()
+            position = encoder.position
+            error = setpoints[axis] - position
+            old_integral = integrals[axis]
+            i_term = kis[axis] * error
+            d_term = kds[axis] * (position - last_positions[axis])
+            if scaled:
+                i_term = (i_term * i_scale + 128) >> 8
+                d_term = (d_term * d_scale + 128) >> 8
+            integral = old_integral + i_term
+            if integral > integral_limit:
+                integral = integral_limit
+            elif integral < -integral_limit:
+                integral = -integral_limit
+
+            output = (kps[axis] * error + integral - d_term + half) >> shift
+            # Don't integrate while saturated in the direction the error pushes
+            if output > limit:
+                output = limit
+                if error > 0:
+                    integral = old_integral
+            elif output < -limit:
+                output = -limit
+                if error < 0:
+                    integral = old_integral
+
+            integrals[axis] = integral
+            last_positions[axis] = position
+            positions[axis] = position
+            outputs[axis] = output
+            motors[axis].set_duty_cycle(output)
@@ -28,9 +28,27 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-import gc                              # Memory allocation garbage collector
-import utime                           # Micropython version of time library
-import micropython                     # This shuts up incorrect warnings
+import array                           # Preallocated storage for traces
+import hal                             # Clock for the board or a computer
+from hal import micropython            # This shuts up incorrect warnings
+
+## Overrun policy: a task which is late by more than a period runs once for
+#  each period missed, one after another, until it has caught up
+CATCH_UP = 0
+
+## Overrun policy: a task which is late by more than a period runs once, and
+#  releases which were missed are skipped so it next runs at the next time
+#  which is a whole number of periods after its original schedule
+SKIP = 1
+
+## Overrun policy: a task which is late by more than a period runs once, and
+#  its schedule is restarted so it next runs one period after this run
+REALIGN = 2
+
+# A count of the changes made by Task.set_phase() to tasks' next run times,
+# which the EDF scheduler compares with the count at which it last built its
+# heap so that it knows when the heap is out of order
+_phase_changes = 0
 
 
 class Task:
@@ -70,7 +88,9 @@ class Task:
 
 
     def __init__(self, run_fun, name="NoName", priority=0, period=None,
-                 profile=False, trace=False, shares=()):
+                 profile=False, trace=False, shares=(), trace_depth=100,
+                 hist_bins=40, hist_width=250, overrun=CATCH_UP, phase=0,
+                 wcet=0, send_dt=False):
         """!
         Initialize a task object so it may be run by the scheduler.
 
@@ -88,10 +108,40 @@ class Task:
                The time can be given in a @c float or @c int; it will be 
                converted to microseconds for internal use by the scheduler.
         @param profile Set to @c True to enable run-time profiling 
-        @param trace Set to @c True to generate a list of transitions between
-               states. @b Note: This slows things down and allocates memory.
+        @param trace Set to @c True to keep a record of the most recent
+               transitions between states. States must be integers which fit
+               in 16 bits; a task which yields @c None is recorded as being in
+               state 0. 
         @param shares A list or tuple of shares and queues used by this task.
                If no list is given, no shares are passed to the task
+        @param trace_depth The number of the most recent state transitions
+               which are kept when tracing, default 100. Memory for these is
+               allocated when the task is created; older transitions are
+               overwritten by newer ones
+        @param hist_bins The number of bins in each of the histograms of run
+               time and lateness kept when profiling, default 40. The last
+               bin counts all times too long to fit in the other bins
+        @param hist_width The width of each histogram bin in microseconds,
+               default 250
+        @param overrun What to do when a timed task is late by a period or
+               more: @c CATCH_UP (the default), @c SKIP or @c REALIGN
+        @param phase A delay in milliseconds added to the time at which a
+               timed task first runs, used to keep tasks whose periods are
+               multiples of each other from all being due at the same times
+        @param wcet An estimate of the task's longest run time in 
+               milliseconds, used in checking whether the task list can be
+               scheduled before the task has been profiled (default 0)
+        @param send_dt Set to @c True to send the task's generator the time
+               in microseconds since the start of its previous run, as the 
+               value of its @c yield expression. The first run, which starts
+               the generator, sends nothing:
+               @code
+                   def control_fun ():
+                       dt = None
+                       while True:
+                           controller.run (dt)
+                           dt = yield
+               @endcode
         """
         # The function which is run to implement this task's code. Since it 
         # is a generator, we "run" it here, which doesn't actually run it but
@@ -108,6 +158,9 @@ class Task:
         #  priority. 
         self.priority = int(priority)
 
+        # The phase is kept in microseconds, as is the period
+        self._phase = int(phase * 1000)
+
         ## The period, in milliseconds, between runs of the task's @c run()
         #  method. If the period is @c None, the @c run() method won't be run
         #  on a time basis but will instead be run by the scheduler as soon
@@ -115,25 +168,53 @@ class Task:
         #  @c go() method. 
         if period != None:
             self.period = int(period * 1000)
-            self._next_run = utime.ticks_us() + self.period
+            self._next_run = hal.ticks_add(hal.ticks_us(),
+                                           self.period + self._phase)
         else:
             self.period = period
             self._next_run = None
 
+        # The estimated longest run time in microseconds
+        self._wcet = int(wcet * 1000)
+
+        ## What to do when the task is late by a period or more, one of 
+        #  @c CATCH_UP, @c SKIP or @c REALIGN
+        self.overrun = overrun
+
+        ## The number of releases of this timed task which were missed, being
+        #  skipped or run a period or more after they were due
+        self.missed = 0
+
         # Flag which causes the task to be profiled, in which the execution
         #  time of the @c run() method is measured and basic statistics kept. 
+        #  Histograms of run time and lateness are allocated here so that
+        #  profiling doesn't allocate memory as the task runs
         self._prof = profile
+        self._hist_width = int(hist_width)
+        if profile:
+            self._run_hist = array.array('L', (0 for _ in range(hist_bins)))
+            self._late_hist = array.array('L', (0 for _ in range(hist_bins)))
         self.reset_profile()
 
         # The previous state in which the task last ran. It is used to watch
         # for and track state transitions.
         self._prev_state = 0
 
-        # If transition tracing has been enabled, create an empty list in 
-        # which to store transition (time, to-state) stamps
+        # If transition tracing has been enabled, allocate a ring buffer in
+        # which to store transition (time since last transition, to-state)
+        # stamps. The buffer is allocated once so that tracing doesn't use up
+        # memory as the task runs
         self._trace = trace
-        self._tr_data = []
-        self._prev_time = utime.ticks_us()
+        if trace:
+            self._tr_dt = array.array('L', (0 for _ in range(trace_depth)))
+            self._tr_st = array.array('h', (0 for _ in range(trace_depth)))
+        self.clear_trace()
+        self._prev_time = hal.ticks_us()
+
+        # If the elapsed time is sent to the generator, the time at which the
+        # previous run started, or None before the first run
+        self._send_dt = send_dt
+        self._last_start = None
 
         ## Flag which is set true when the task is ready to be run by the
         #  scheduler
@@ -150,50 +231,76 @@ class Task:
         @return @c True if the task ran or @c False if it did not
         """
         if self.ready():
+            self.run()
+            return True
+
+        else:
+            return False
 
-            # Reset the go flag for the next run
-            self.go_flag = False
 
-            # If profiling, save the start time
-            if self._prof:
-                stime = utime.ticks_us()
+    def run(self):
+        """!
+        This method runs the task's generator up to the next @c yield(), 
+        keeping profiling and tracing data, without checking if the task is
+        ready to run. It is called by @c schedule() and by schedulers which 
+        decide when tasks run by other means. 
+        """
+        # Reset the go flag for the next run
+        self.go_flag = False
 
-            # Run the method belonging to the state which should be run next
+        # If profiling or sending the elapsed time, save the start time
+        if self._prof or self._send_dt:
+            stime = hal.ticks_us()
+
+        # Run the method belonging to the state which should be run next,
+        # sending it the time since its last run if it wants that
+        if self._send_dt:
+            last = self._last_start
+            self._last_start = stime
+            if last is not None:
+                curr_state = self._run_gen.send(hal.ticks_diff(stime, last))
+            else:
+                curr_state = next(self._run_gen)
+        else:
             curr_state = next(self._run_gen)
 
-            # If profiling or tracing, save timing data
-            if self._prof or self._trace:
-                etime = utime.ticks_us()
-
-            # If profiling, save timing data
-            if self._prof:
-                self._runs += 1
-                runt = utime.ticks_diff(etime, stime)
-                if self._runs > 2:
-                    self._run_sum += runt
-                    if runt > self._slowest:
-                        self._slowest = runt
-
-            # If transition logic tracing is on, record a transition; if not,
-            # ignore the state. If out of memory, switch tracing off and 
-            # run the memory allocation garbage collector
-            if self._trace:
-                try:
-                    if curr_state != self._prev_state:
-                        self._tr_data.append(
-                            (utime.ticks_diff(etime, self._prev_time),
-                             curr_state))
-                except MemoryError:
-                    self._trace = False
-                    gc.collect()
-
-                self._prev_state = curr_state
+        # If profiling or tracing, save timing data
+        if self._prof or self._trace:
+            etime = hal.ticks_us()
+
+        # If profiling, save timing data
+        if self._prof:
+            self._runs += 1
+            runt = hal.ticks_diff(etime, stime)
+            if self._runs > 2:
+                self._run_sum += runt
+                if runt > self._slowest:
+                    self._slowest = runt
+                hist = self._run_hist
+                idx = runt // self._hist_width
+                if idx >= len(hist):
+                    idx = len(hist) - 1
+                hist[idx] += 1
+
+        # If transition logic tracing is on, record a transition in the
+        # ring buffer, overwriting the oldest one if the buffer is full
+        if self._trace:
+            if curr_state is None:
+                curr_state = 0
+            if curr_state != self._prev_state:
+                idx = self._tr_idx
+                if self._tr_count >= len(self._tr_st):
+                    self._tr_from = self._tr_st[idx]
+                self._tr_dt[idx] = hal.ticks_diff(etime, self._prev_time)
+                self._tr_st[idx] = curr_state
+                idx += 1
+                if idx >= len(self._tr_st):
+                    idx = 0
+                self._tr_idx = idx
+                self._tr_count += 1
                 self._prev_time = etime
 
-            return True
-
-        else:
-            return False
+            self._prev_state = curr_state
 
 
     @micropython.native
@@ -204,26 +311,60 @@ class Task:
         this method checks the flag which indicates that the task is ready to
         go. This method may be overridden in descendent classes to implement
         some other behavior.
+
+        If the task is found to be a period or more late, the next run time
+        is chosen according to the task's overrun policy and the missed
+        releases are counted.
         """
         # If this task uses a timer, check if it's time to run run() again. If
         # so, set go flag and set the timer to go off at the next run time
         if self.period != None:
-            late = utime.ticks_diff(utime.ticks_us(), self._next_run)
+            now = hal.ticks_us()
+            late = hal.ticks_diff(now, self._next_run)
             if late > 0:
                 self.go_flag = True
-                self._next_run = utime.ticks_diff(self.period, 
-                                                  -self._next_run)
+                period = self.period
+                if late < period:
+                    self._next_run = hal.ticks_add(self._next_run, period)
+                elif self.overrun == CATCH_UP:
+                    self.missed += 1
+                    self._next_run = hal.ticks_add(self._next_run, period)
+                elif self.overrun == SKIP:
+                    skipped = late // period
+                    self.missed += skipped
+                    self._next_run = hal.ticks_add(self._next_run,
+                                                   (skipped + 1) * period)
+                else:
+                    self.missed += late // period
+                    self._next_run = hal.ticks_add(now, period)
 
                 # If keeping a latency profile, record the data
                 if self._prof:
-                    self._late_sum += late
-                    if late > self._latest:
-                        self._latest = late
+                    self.note_late(late)
 
         # If the task doesn't use a timer, we rely on go_flag to signal ready
         return self.go_flag
 
 
+    @micropython.native
+    def note_late(self, late):
+        """!
+        This method records how late the task was made ready to run in the
+        task's latency profile. It is called by @c ready() and by schedulers
+        which decide when tasks run by other means. 
+        @param late The time in microseconds after the task was due that it
+               was made ready to run
+        """
+        self._late_sum += late
+        if late > self._latest:
+            self._latest = late
+        hist = self._late_hist
+        idx = late // self._hist_width
+        if idx >= len(hist):
+            idx = len(hist) - 1
+        hist[idx] += 1
+
+
     def set_period(self, new_period):
         """!
         This method sets the period between runs of the task to the given
@@ -237,38 +378,176 @@ class Task:
             self.period = int(new_period) * 1000
 
 
+    def set_phase(self, new_phase, start=None):
+        """!
+        This method sets the delay which is added to the times at which a
+        timed task runs and restarts the task's schedule, so that it next runs
+        one period plus the new phase after the given starting time. 
+        @param new_phase The new phase in milliseconds
+        @param start The time, from @c hal.ticks_us(), from which the new
+               schedule is started, or @c None to start it now. Tasks whose
+               phases are set from the same starting time keep their phases
+               relative to each other
+        """
+        global _phase_changes
+        self._phase = int(new_phase * 1000)
+        if self.period != None:
+            if start is None:
+                start = hal.ticks_us()
+            self._next_run = hal.ticks_add(start, self.period + self._phase)
+            _phase_changes += 1
+
+
     def reset_profile(self):
         """!
-        This method resets the variables used for execution time profiling.
-        This method is also used by @c __init__() to create the variables.
+        This method resets the variables used for execution time profiling and
+        the count of missed releases. This method is also used by 
+        @c __init__() to create the variables.
         """
         self._runs = 0
+        self.missed = 0
         self._run_sum = 0
         self._slowest = 0
         self._late_sum = 0
         self._latest = 0
+        self.reset_histograms()
+
+
+    def reset_histograms(self):
+        """!
+        This method clears the histograms of run time and lateness which are
+        kept when profiling. It is also called by @c reset_profile().
+        """
+        if self._prof:
+            for hist in (self._run_hist, self._late_hist):
+                for idx in range(len(hist)):
+                    hist[idx] = 0
+
+
+    def percentile(self, pct, late=False):
+        """!
+        This method estimates a percentile of the task's run time or lateness
+        from the histograms kept when profiling. 
+        @param pct The percentile to find, for example 95 or 99
+        @param late @c True to find a percentile of lateness or @c False 
+               (the default) for a percentile of run time
+        @return The upper edge, in microseconds, of the histogram bin in 
+                which the percentile lies; @c None if it lies in the last bin
+                (so it's longer than the histogram covers) or if no data has 
+                been collected
+        """
+        if not self._prof:
+            return None
+        hist = self._late_hist if late else self._run_hist
+        total = sum(hist)
+        if total == 0:
+            return None
+        target = total * pct / 100.0
+        count = 0
+        for idx in range(len(hist) - 1):
+            count += hist[idx]
+            if count >= target:
+                return (idx + 1) * self._hist_width
+        return None
+
+
+    def get_histogram(self, late=False):
+        """!
+        This method returns a string showing one of the task's profiling 
+        histograms, with one line for each bin which holds any counts.
+        @param late @c True to show the histogram of lateness or @c False 
+               (the default) to show the histogram of run time
+        @return A string showing the histogram
+        """
+        hist_str = 'Task ' + self.name + (' lateness' if late else ' run time')
+        if not self._prof:
+            return hist_str + ' not profiled'
+        hist_str += ' (ms):\n'
+        hist = self._late_hist if late else self._run_hist
+        width = self._hist_width / 1000.0
+        for idx in range(len(hist)):
+            if hist[idx]:
+                if idx < len(hist) - 1:
+                    hist_str += f"{(idx * width): 8.2f} -"
+                    hist_str += f"{((idx + 1) * width): 8.2f}"
+                else:
+                    hist_str += f"{(idx * width): 8.2f} -     ...."
+                hist_str += f"{hist[idx]: 10d}\n"
+        return hist_str
+
+
+    def clear_trace(self):
+        """!
+        This method empties the buffer of state transitions kept when tracing.
+        """
+        self._tr_idx = 0
+        self._tr_count = 0
+        self._tr_from = 0
 
 
-    def get_trace(self):
+    def wcet(self):
+        """!
+        This method gives the longest run time of the task which is used in
+        checking if a task list can be scheduled: the longest run time which 
+        has been measured while profiling or the estimate given when the task
+        was created, whichever is longer.
+        @return The longest run time in microseconds
+        """
+        return max(self._slowest, self._wcet)
+
+
+    def get_trace(self, stream=None):
         """!
         This method returns a string containing the task's transition trace.
-        The trace is a set of tuples, each of which contains a time and the
-        states from and to which the system transitioned. 
-        @return A possibly quite large string showing state transitions
+        The trace is a set of lines, each of which contains a time and the
+        states from and to which the system transitioned. Times are measured
+        from the first transition which caused the oldest one kept to be
+        overwritten, or from the creation of the task if none has been. 
+        If a stream such as a UART or file is given, the lines are written to
+        it one at a time instead, so that a long trace can be sent out without
+        building one large string in memory.
+        @param stream An object with a @c write() method to which the trace is
+               written, or @c None to return the trace as a string
+        @return A string showing state transitions, or @c None if the trace
+                was written to a stream
         """
-        tr_str = 'Task ' + self.name + ':'
-        if self._trace:
-            tr_str += '\n'
-            last_state = 0
-            total_time = 0.0
-            for item in self._tr_data:
-                total_time += item[0] / 1000000.0
-                tr_str += '{: 12.6f}: {: 2d} -> {:d}\n'.format (total_time, 
-                    last_state, item[1])
-                last_state = item[1]
+        lines = self._trace_lines()
+        if stream is None:
+            return ''.join(lines)
+        for line in lines:
+            stream.write(line)
+
+
+    def _trace_lines(self):
+        """!
+        This generator produces the lines of the task's transition trace, 
+        from the oldest transition which has been kept to the newest one.
+        """
+        yield 'Task ' + self.name + ':'
+        if not self._trace:
+            yield ' not traced'
+            return
+
+        depth = len(self._tr_st)
+        if self._tr_count > depth:
+            yield f" {self._tr_count - depth} older transitions overwritten\n"
+            idx = self._tr_idx
+            count = depth
         else:
-            tr_str += ' not traced'
-        return tr_str
+            yield '\n'
+            idx = 0
+            count = self._tr_count
+
+        last_state = self._tr_from
+        total_time = 0.0
+        for _ in range(count):
+            total_time += self._tr_dt[idx] / 1000000.0
+            yield '{: 12.6f}: {: 2d} -> {:d}\n'.format(total_time,
+                last_state, self._tr_st[idx])
+            last_state = self._tr_st[idx]
+            idx += 1
+            if idx >= depth:
+                idx = 0
 
 
     def go(self):
@@ -292,6 +571,10 @@ class Task:
         except TypeError:
             rst += '         -'
         rst += f"{self._runs: 8d}"
+        if self.period != None:
+            rst += f"{self.missed: 8d}"
+        else:
+            rst += '       -'
 
         if self._prof and self._runs > 0:
             avg_dur = (self._run_sum / self._runs) / 1000.0
@@ -302,6 +585,29 @@ class Task:
         return rst
 
 
+def _gcd(num_a, num_b):
+    """!
+    Find the greatest common divisor of two positive integers.
+    """
+    while num_b:
+        num_a, num_b = num_b, num_a % num_b
+    return num_a
+
+
+@micropython.native
+def _runs_before(task_a, task_b) -> bool:
+    """!
+    Check if one timed task should run before another one. Times are compared
+    with @c ticks_diff() so that this works when the microsecond timer wraps.
+    @param task_a The task which might run first
+    @param task_b The task which might run second
+    @return @c True if @c task_a is due before @c task_b, or if they're due at
+            the same time and @c task_a has a higher priority
+    """
+    diff = hal.ticks_diff(task_a._next_run, task_b._next_run)
+    return diff < 0 or (diff == 0 and task_a.priority > task_b.priority)
+
+
 # =============================================================================
 
 class TaskList:
@@ -316,7 +622,9 @@ class TaskList:
     The task list is sorted by priority so that the scheduler can efficiently
     look through the list to find the highest priority task which is ready to
     run at any given time. Tasks can also be scheduled in a simpler
-    "round-robin" fashion.
+    "round-robin" fashion, in order of the time at which each is next due
+    to run ("earliest deadline first"), or from a table of which tasks run
+    at which times which is made before the scheduler starts ("cyclic"). 
     """
 
     def __init__(self):
@@ -330,14 +638,50 @@ class TaskList:
         #  that priority. 
         self.pri_list = []
 
+        ## What to do when a task is appended which makes the task list fail
+        #  the check done by @c schedulable(): @c None to do nothing, 
+        #  @c 'warn' to print a warning, or @c 'refuse' to raise a 
+        #  @c ValueError and not append the task
+        self.admission = None
+
+        ## The scheduler assumed by the admission check, @c 'pri' for 
+        #  @c pri_sched() or @c 'edf' for @c edf_sched()
+        self.admission_sched = 'pri'
+
+        # Tasks kept in a binary min-heap ordered by next run time for the
+        # earliest-deadline-first scheduler, and the untimed tasks which it
+        # must poll. The heap is rebuilt when the list of tasks changes or
+        # when a task's next run time is changed by Task.set_phase()
+        self._edf_heap = None
+        self._edf_untimed = []
+        self._edf_changes = 0
+
+        # Time spent idle by idle_sched() and the time at which idle time
+        # measurement began, used to compute CPU utilization
+        self.reset_idle()
+
+        # The dispatch table made by compile_cyclic(), or None if the cyclic
+        # scheduler hasn't been set up
+        self._cyc_table = None
+
 
     def append(self, task):
         """!
         Append a task to the task list. The list will be sorted by task 
         priorities so that the scheduler can quickly find the highest priority
         task which is ready to run at any given time. 
+        If an admission policy has been set in @c admission, the task list with
+        the new task is first checked to see if it can be scheduled.
         @param task The task to be appended to the list
         """
+        if self.admission and task.period != None:
+            if not self.schedulable(self.admission_sched, task):
+                if self.admission == 'refuse':
+                    raise ValueError('Task ' + task.name + 
+                                     ' makes tasks unschedulable')
+                print('Warning: task ' + task.name +
+                      ' makes tasks unschedulable')
+
         # See if there's a tasklist with the given priority in the main list
         new_pri = task.priority
         for pri in self.pri_list:
@@ -357,6 +701,231 @@ class TaskList:
         # Make sure the main list (of lists at each priority) is sorted
         self.pri_list.sort(key=lambda pri: pri[0], reverse=True)
 
+        # The deadline heap is rebuilt the next time edf_sched() is called
+        self._edf_heap = None
+
+
+    def _tasks(self, extra=None):
+        """!
+        Make a list of all the tasks in the list, highest priority first.
+        @param extra A task which is not in the list to be included, or 
+               @c None
+        @return A new list of tasks
+        """
+        tasks = [task for pri in self.pri_list for task in pri[2:]]
+        if extra is not None:
+            tasks.append(extra)
+            tasks.sort(key=lambda task: task.priority, reverse=True)
+        return tasks
+
+
+    def utilization(self, extra=None):
+        """!
+        Compute the fraction of CPU time used by each timed task, found from
+        its longest run time as given by @c Task.wcet() and its period, and 
+        the total for all timed tasks. Run times are updated while tasks are
+        profiled, so this can be checked as the system runs.
+        @param extra A task which is not in the list to be included, or 
+               @c None
+        @return A tuple holding a list of (task name, utilization) tuples and
+                the total utilization of all timed tasks
+        """
+        per_task = [(task.name, task.wcet() / task.period) 
+                    for task in self._tasks(extra) if task.period != None]
+        return per_task, sum(util for name, util in per_task)
+
+
+    def response_times(self, extra=None):
+        """!
+        Compute the worst-case response time of each timed task when tasks
+        are scheduled by @c pri_sched().
+
+        Since tasks are scheduled cooperatively, a task which becomes ready
+        may have to wait for the longest-running task of lower priority which
+        has just started, and then for every run of each task of higher or
+        equal priority which becomes ready before it gets to run. The response
+        time is found by repeating that sum until it stops changing, as in
+        the usual analysis of non-preemptive fixed-priority scheduling, with 
+        each task's run time from @c Task.wcet(). Untimed tasks are counted
+        only as lower priority tasks which may be running. 
+        @param extra A task which is not in the list to be included, or 
+               @c None
+        @return A list of (task name, response time in microseconds) tuples,
+                the response time being @c None if it would be longer than
+                the task's period
+        """
+        tasks = self._tasks(extra)
+        timed = [task for task in tasks if task.period != None]
+        results = []
+        for task in timed:
+            blocking = 0
+            for other in tasks:
+                if other is not task and (other.period is None
+                                          or other.priority < task.priority):
+                    blocking = max(blocking, other.wcet())
+            others = [other for other in timed if other is not task
+                      and other.priority >= task.priority]
+
+            wait = blocking
+            while True:
+                new_wait = blocking
+                for other in others:
+                    new_wait += (wait // other.period + 1) * other.wcet()
+                if new_wait + task.wcet() > task.period:
+                    results.append((task.name, None))
+                    break
+                if new_wait == wait:
+                    results.append((task.name, wait + task.wcet()))
+                    break
+                wait = new_wait
+        return results
+
+
+    def schedulable(self, sched='pri', extra=None):
+        """!
+        Check whether the timed tasks can all run within their periods.
+
+        For @c 'pri', every task's worst-case response time from 
+        @c response_times() must be no longer than its period. For @c 'edf',
+        the total utilization plus, for each task, the longest run time of a
+        task with a longer period divided by that task's period (the time it
+        may have to wait because tasks aren't preempted) must not be more than
+        one. Both checks rely on the longest run times given by
+        @c Task.wcet(), so they're only as good as the profiling data or
+        estimates.
+        @param sched The scheduler to be checked, @c 'pri' or @c 'edf'
+        @param extra A task which is not in the list to be included, or 
+               @c None
+        @return @c True if the tasks can be scheduled, @c False if not
+        """
+        if sched == 'edf':
+            per_task, total = self.utilization(extra)
+            timed = [task for task in self._tasks(extra) 
+                     if task.period != None]
+            for task in timed:
+                blocking = 0
+                for other in timed:
+                    if other.period > task.period:
+                        blocking = max(blocking, other.wcet())
+                if total + blocking / task.period > 1.0:
+                    return False
+            return total <= 1.0
+
+        for name, resp in self.response_times(extra):
+            if resp is None:
+                return False
+        return True
+
+
+    def schedulability(self):
+        """!
+        Create some diagnostic text showing each timed task's longest run 
+        time, CPU utilization and worst-case response time under 
+        @c pri_sched(), in milliseconds, and whether the task list passes the
+        checks done by @c schedulable(). Response times longer than the 
+        task's period are shown as @c ---.
+        @return A string containing a table of schedulability data
+        """
+        per_task, total = self.utilization()
+
+        # Response times are listed in the same order as the timed tasks; 
+        # they're matched by place, as tasks may share a name
+        timed = [task for task in self._tasks() if task.period != None]
+        ret_str = 'TASK                PERIOD      WCET  UTIL (%)  RESPONSE\n'
+        for task, (name, resp) in zip(timed, self.response_times()):
+            ret_str += f"{task.name:<16s}{(task.period / 1000.0): 10.1f}"
+            ret_str += f"{(task.wcet() / 1000.0): 10.3f}"
+            ret_str += f"{(task.wcet() * 100.0 / task.period): 10.1f}"
+            if resp is None:
+                ret_str += '       ---\n'
+            else:
+                ret_str += f"{(resp / 1000.0): 10.3f}\n"
+        ret_str += f"Total utilization {(total * 100.0):.1f}%, "
+        ret_str += 'schedulable by pri_sched: ' + str(self.schedulable('pri'))
+        ret_str += ', edf_sched: ' + str(self.schedulable('edf')) + '\n'
+        return ret_str
+
+
+    def auto_phase(self, resolution=1, max_slots=10000):
+        """!
+        Choose phases for the timed tasks which spread their runs out in time.
+
+        Tasks whose periods are multiples of each other, such as 50 ms and
+        250 ms, are all due at the same times if they're started together,
+        so some of them run late. This method looks at the times at which the
+        tasks run over one hyperperiod, the least common multiple of their 
+        periods, and gives each task in turn, from highest priority to lowest,
+        the phase at which its runs overlap the runs of the tasks already
+        placed the least. Each run is taken to last for the task's longest
+        measured run time if it has been profiled, or one time slot if not.
+        Among equally good phases, the middle of the longest range of them is
+        chosen so that runs are as far apart as possible. The tasks' schedules
+        are all restarted from the current time with their new phases.
+        @param resolution The size of a time slot, in milliseconds
+        @param max_slots The largest number of time slots in a hyperperiod
+               which will be searched; if the hyperperiod is longer, a
+               @c ValueError is raised and a larger resolution should be used
+        @return A list of (task name, phase in milliseconds) tuples
+        """
+        slot = int(resolution * 1000)
+        tasks = []
+        for pri in self.pri_list:
+            tasks += sorted((task for task in pri[2:] if task.period != None),
+                            key=lambda task: task.period)
+
+        # Find the hyperperiod in time slots
+        hyper = 1
+        for task in tasks:
+            periods = max(1, task.period // slot)
+            hyper = hyper * periods // _gcd(hyper, periods)
+            if hyper > max_slots:
+                raise ValueError('Hyperperiod too long for auto_phase()')
+
+        # The number of runs of tasks already placed during each time slot
+        load = [0] * hyper
+        phases = []
+        for task in tasks:
+            periods = max(1, task.period // slot)
+            width = max(1, -(-task._slowest // slot))
+
+            # Find the worst overlap for each possible phase
+            peaks = []
+            for offset in range(periods):
+                peak = 0
+                for start in range(offset, hyper, periods):
+                    for idx in range(start, start + width):
+                        if load[idx % hyper] > peak:
+                            peak = load[idx % hyper]
+                peaks.append(peak)
+
+            # Choose the middle of the longest run of the best phases
+            best = min(peaks)
+            run_start = run_len = best_start = best_len = 0
+            for offset in range(periods):
+                if peaks[offset] == best:
+                    if run_len == 0:
+                        run_start = offset
+                    run_len += 1
+                    if run_len > best_len:
+                        best_start, best_len = run_start, run_len
+                else:
+                    run_len = 0
+            offset = best_start + (best_len - 1) // 2
+
+            for start in range(offset, hyper, periods):
+                for idx in range(start, start + width):
+                    load[idx % hyper] += 1
+            phases.append((task, offset * slot / 1000.0))
+
+        # Restart all the tasks' schedules together with their new phases
+        now = hal.ticks_us()
+        for task, phase in phases:
+            task.set_phase(phase, now)
+
+        # The deadline heap is rebuilt the next time edf_sched() is called
+        self._edf_heap = None
+        return [(task.name, phase) for task, phase in phases]
+
 
     @micropython.native
     def rr_sched(self):
@@ -370,11 +939,15 @@ class TaskList:
         tasks are given a chance to run each time through the list, and it takes
         about the same amount of time before each is given a chance to run 
         again.
+        @return @c True if any task was run or @c False if none was ready
         """
         # For each priority level, run all tasks at that level
+        ran = False
         for pri in self.pri_list:
             for task in pri[2:]:
-                task.schedule()
+                if task.schedule():
+                    ran = True
+        return ran
 
 
     @micropython.native
@@ -385,6 +958,7 @@ class TaskList:
         This scheduler runs tasks in a priority based fashion. Each time it is
         called, it finds the highest priority task which is ready to run and
         calls that task's @c run() method.
+        @return @c True if a task was run or @c False if no task was ready
         """
         # Go down the list of priorities, beginning with the highest
         for pri in self.pri_list:
@@ -400,19 +974,373 @@ class TaskList:
                 if pri[1] >= length:
                     pri[1] = 2
                 if ran:
-                    return
+                    return True
+
+        return False
+
+
+    def idle_sched(self, max_idle=10000, sched=None):
+        """!
+        Run tasks according to their priorities, idling when none is ready.
+
+        This scheduler runs the highest priority ready task as @c pri_sched()
+        does. If no task is ready, it finds the time until the next task is
+        due to run and waits instead of returning at once, so the scheduler
+        loop doesn't keep the CPU busy checking tasks which aren't ready. On a
+        board, it waits for an interrupt; the timer tick interrupt wakes the
+        CPU at least once per millisecond, as does any interrupt which might
+        call a task's @c go() method. Elsewhere, it idles as the clock chosen
+        with @c hal.use() does until the next task is due. The time spent 
+        waiting is added up so that CPU utilization can be found with 
+        @c cpu_load().
+        @param max_idle The longest time in microseconds to sleep at once when
+               not running on a board, used when untimed tasks may be made
+               ready by other code while the scheduler sleeps
+        @param sched The scheduler used to run a ready task, such as 
+               @c task_list.edf_sched, which must return @c True if it ran
+               a task; @c None to use @c pri_sched()
+        """
+        if sched is None:
+            sched = self.pri_sched
+        if sched():
+            return
+
+        wait = self.time_to_next()
+        if wait is not None and wait <= 0:
+            return
+
+        if wait is None or wait > max_idle:
+            wait = max_idle
+        start = hal.ticks_us()
+        hal.idle(wait)
+        self._idle_us += hal.ticks_diff(hal.ticks_us(), start)
+
+
+    def time_to_next(self):
+        """!
+        Find how long it will be until the next task is ready to run.
+        @return The time in microseconds until the first timed task becomes
+                ready to run, zero or less if one is ready now or if an 
+                untimed task's @c go() method has been called, or @c None if
+                there are no timed tasks. Once @c compile_cyclic() has been 
+                called, the time is that until the next frame is due; with a
+                timer, it's zero if a frame is due and otherwise one frame 
+                time, as the timer's interrupt marks the next frame
+        """
+        now = hal.ticks_us()
+        if self._cyc_table is not None:
+            for task in self._cyc_untimed:
+                if task.go_flag:
+                    return 0
+            if self._cyc_timer is not None:
+                return 0 if self._cyc_ticks != self._cyc_done \
+                    else self._cyc_frame
+            return hal.ticks_diff(self._cyc_next, now) + 1
+
+        soonest = None
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task.period is None:
+                    if task.go_flag:
+                        return 0
+                else:
+                    wait = hal.ticks_diff(task._next_run, now) + 1
+                    if soonest is None or wait < soonest:
+                        soonest = wait
+        return soonest
+
+
+    def reset_idle(self):
+        """!
+        Reset the measurement of time spent idle by @c idle_sched().
+        """
+        self._idle_us = 0
+        self._idle_start = hal.ticks_us()
+
+
+    def cpu_load(self):
+        """!
+        Compute the fraction of time the CPU has been busy since idle time
+        measurement was started or last reset. Only the time spent waiting
+        inside @c idle_sched() counts as idle time. Measurements over periods
+        of more than about nine minutes are wrong because the microsecond 
+        timer wraps around.
+        @return The fraction of time busy, from 0.0 to 1.0
+        """
+        elapsed = hal.ticks_diff(hal.ticks_us(), self._idle_start)
+        if elapsed <= 0:
+            return 0.0
+        return 1.0 - self._idle_us / elapsed
+
+
+    def compile_cyclic(self, max_frames=1000, timer=None):
+        """!
+        Set up the cyclic scheduler, which runs timed tasks from a table.
+
+        When the set of tasks doesn't change while the system runs, there's
+        no need to ask each task whether it's ready. This method divides time
+        into frames, each as long as the greatest common divisor of the 
+        periods and phases of the timed tasks, and makes a table with one
+        entry for each frame in the hyperperiod (the least common multiple of
+        the periods). Each entry holds the tasks which are due in that frame,
+        in order of priority. @c cyclic_sched() then runs one entry of the
+        table per frame. Untimed tasks are run, in order of priority, when
+        their @c go() methods have been called and no frame is due. 
+
+        This method must be called again if tasks are added or their periods
+        or phases are changed, including by @c Task.set_period(),
+        @c Task.set_phase() or @c auto_phase(); the table isn't updated by
+        those changes. The first frame begins one frame time after this 
+        method is called.
+        @param max_frames The largest number of frames allowed in the table;
+               if more would be needed, a @c ValueError is raised
+        @param timer A timer such as a @c pyb.Timer which will be set to
+               interrupt once per frame and mark each frame as due, or 
+               @c None to check the time on each call to @c cyclic_sched()
+               instead
+        @return The length of a frame in milliseconds
+        """
+        timed = []
+        untimed = []
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task.period is None:
+                    untimed.append(task)
+                else:
+                    timed.append(task)
+        if not timed:
+            raise ValueError('No timed tasks for compile_cyclic()')
+
+        frame = 0
+        hyper = 1
+        for task in timed:
+            frame = _gcd(frame, task.period)
+            frame = _gcd(frame, task._phase)
+            hyper = hyper * task.period // _gcd(hyper, task.period)
+        frames = hyper // frame
+        if frames > max_frames:
+            raise ValueError('Too many frames for compile_cyclic()')
+
+        # A task is due in each frame which starts at its phase plus a whole
+        # number of periods
+        table = []
+        for num in range(frames):
+            now = num * frame
+            table.append(tuple(task for task in timed 
+                               if (now - task._phase) % task.period == 0))
+
+        self._cyc_table = table
+        self._cyc_untimed = untimed
+        self._cyc_frame = frame
+        self._cyc_idx = 0
+        self._cyc_next = hal.ticks_add(hal.ticks_us(), frame)
+
+        ## The number of frames which began before the previous frame's tasks
+        #  had been run, so their tasks ran late
+        self.frame_overruns = 0
+
+        # Frames are counted by the timer's interrupt and by the scheduler;
+        # each counter is written by only one of them
+        self._cyc_timer = timer
+        self._cyc_ticks = 0
+        self._cyc_done = 0
+        if timer is not None:
+            timer.init(freq=1000000 / frame)
+            timer.callback(self._cyclic_tick)
+
+        return frame / 1000.0
+
+
+    def _cyclic_tick(self, timer):
+        """!
+        Mark one frame as due. This is the timer interrupt callback used by 
+        the cyclic scheduler when it is given a timer.
+        @param timer The timer which caused the interrupt
+        """
+        self._cyc_ticks += 1
+
+
+    @micropython.native
+    def cyclic_sched(self):
+        """!
+        Run the tasks in the next frame of the table made by 
+        @c compile_cyclic() if that frame is due.
+
+        If no frame is due, an untimed task whose @c go() method has been 
+        called is run instead. If @c compile_cyclic() hasn't been called, 
+        this method runs @c pri_sched() as a fallback. 
+        @return @c True if any task was run or @c False if none was
+        """
+        table = self._cyc_table
+        if table is None:
+            return self.pri_sched()
+
+        # Find if the next frame is due, from the timer's count of frames or
+        # from the clock
+        if self._cyc_timer is None:
+            frame_time = self._cyc_next
+            late = hal.ticks_diff(hal.ticks_us(), frame_time)
+            due = late >= 0
+            if due:
+                self._cyc_next = hal.ticks_add(frame_time, self._cyc_frame)
+                if late >= self._cyc_frame:
+                    self.frame_overruns += 1
+        else:
+            pending = self._cyc_ticks - self._cyc_done
+            due = pending > 0
+            if due:
+                self._cyc_done += 1
+                if pending > 1:
+                    self.frame_overruns += 1
+
+        if due:
+            idx = self._cyc_idx
+            for task in table[idx]:
+                if task._prof and self._cyc_timer is None:
+                    task.note_late(hal.ticks_diff(hal.ticks_us(), frame_time))
+                task.run()
+            idx += 1
+            if idx >= len(table):
+                idx = 0
+            self._cyc_idx = idx
+            return True
+
+        for task in self._cyc_untimed:
+            if task.schedule():
+                return True
+        return False
+
+
+    @micropython.native
+    def edf_sched(self):
+        """!
+        Run tasks in order of their next run times (earliest deadline first).
+
+        Timed tasks are kept in a heap sorted by the time at which each is next
+        due to run, so each time this scheduler is called it only has to check
+        the one task at the top of the heap rather than asking every task if
+        it's ready. When two tasks are due at the same time, the one with the
+        higher priority runs first. Tasks which have no period are run when
+        their @c go() method has been called, in priority order, only if no
+        timed task is due. Because only the task at the top of the heap is 
+        checked, timed tasks which override @c ready() or whose @c go() method
+        is called are not run early by this scheduler. The heap is rebuilt 
+        when tasks are appended and after any task's @c set_phase() method 
+        has been called, as that moves the task's next run time.
+        @return @c True if a task was run or @c False if no task was ready
+        """
+        if self._edf_heap is None or self._edf_changes != _phase_changes:
+            self._edf_build()
+
+        # If the earliest timed task is due, run it and move it down the heap
+        # to its place according to its new next run time
+        heap = self._edf_heap
+        if heap:
+            head = heap[0]
+            if hal.ticks_diff(hal.ticks_us(), head._next_run) > 0:
+                ran = head.schedule()
+                self._edf_sift(0)
+                return ran
+
+        # No timed task is due, so give an untimed task a chance to run
+        for task in self._edf_untimed:
+            if task.schedule():
+                return True
+        return False
+
+
+    def _edf_build(self):
+        """!
+        Build the heap of timed tasks used by the @c edf_sched() scheduler and
+        the list of untimed tasks, which is kept in order of priority.
+        """
+        heap = []
+        untimed = []
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task.period is None:
+                    untimed.append(task)
+                else:
+                    heap.append(task)
+
+        self._edf_heap = heap
+        self._edf_untimed = untimed
+        self._edf_changes = _phase_changes
+        for idx in range(len(heap) // 2 - 1, -1, -1):
+            self._edf_sift(idx)
+
+
+    @micropython.native
+    def _edf_sift(self, idx):
+        """!
+        Move the task at the given place in the heap down until neither of
+        the tasks below it is due to run before it.
+        @param idx The index in the heap of the task to be moved
+        """
+        heap = self._edf_heap
+        length = len(heap)
+        task = heap[idx]
+        while True:
+            child = 2 * idx + 1
+            if child >= length:
+                break
+            other = child + 1
+            if other < length and _runs_before(heap[other], heap[child]):
+                child = other
+            if not _runs_before(heap[child], task):
+                break
+            heap[idx] = heap[child]
+            idx = child
+        heap[idx] = task
+
+
+    def reset_profile(self):
+        """!
+        Reset the execution time profiles, including histograms, of all the
+        tasks in the list.
+        """
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                task.reset_profile()
+
+
+    def percentiles(self):
+        """!
+        Create some diagnostic text showing the 50th, 95th and 99th percentile
+        run times and lateness of each task in milliseconds, estimated from 
+        the tasks' profiling histograms. Times longer than the histograms 
+        cover are shown as @c ---.
+        @return A string containing a table of percentiles
+        """
+        ret_str = 'TASK               RUN P50   RUN P95   RUN P99  LATE P50' \
+            '  LATE P95  LATE P99\n'
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                ret_str += f"{task.name:<16s}"
+                for late in (False, True):
+                    for pct in (50, 95, 99):
+                        val = task.percentile(pct, late)
+                        if val is None:
+                            ret_str += '       ---'
+                        else:
+                            ret_str += f"{(val / 1000.0): 10.3f}"
+                ret_str += '\n'
+        return ret_str
 
 
     def __repr__(self):
         """!
         Create some diagnostic text showing the tasks in the task list.
         """
-        ret_str = 'TASK             PRI    PERIOD    RUNS   AVG DUR   MAX ' \
-            'DUR  AVG LATE  MAX LATE\n'
+        ret_str = 'TASK             PRI    PERIOD    RUNS  MISSED   AVG DUR' \
+            '   MAX DUR  AVG LATE  MAX LATE\n'
         for pri in self.pri_list:
             for task in pri[2:]:
                 ret_str += str(task) + '\n'
 
+        if self._idle_us > 0:
+            ret_str += f"CPU load {(self.cpu_load() * 100.0):.1f}%\n"
+
         return ret_str
 
 
@@ -47,12 +47,13 @@ class Encoder:
         self.old_delta = 0
         print ("Creating Encoder")
 
-    def read(self):
+    def update(self):
         '''!
-        @brief      Reads and updates the encoder's position.
-        @details    The read method retrieves the delta between the current and previous reading from the timer's counter,
+        @brief      Updates the encoder's position without printing it.
+        @details    The update method retrieves the delta between the current and previous reading from the timer's counter,
                     checks for overflow or underflow in the readings, updates the old_delta and prev_position, and
-                    calculates the encoder's current position. The method then prints the updated position.
+                    calculates the encoder's current position. It allocates no memory, so it can be called in a
+                    control loop which must not leave work for the garbage collector.
         @param      self The object itself
         @return     None
         '''
@@ -73,6 +74,15 @@ class Encoder:
         self.old_delta = new_delta
         self.prev_position = self.position
         self.position -= delta_1
+
+    def read(self):
+        '''!
+        @brief      Reads and updates the encoder's position.
+        @details    The read method updates the encoder's position as update does, then prints the updated position.
+        @param      self The object itself
+        @return     None
+        '''
+        self.update()
         print(self.position)
 
     def zero(self):
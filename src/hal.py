@@ -0,0 +1,313 @@
+"""!
+@file hal.py
+    This file contains the clock and platform layer used by the cotask scheduler and the task_share
+    module. On a board it passes calls through to @c utime and @c pyb; on a computer running CPython
+    it supplies a clock based on the computer's timer and stand-ins for the MicroPython-only modules,
+    so that tasks and the scheduler can be run and measured off the board. A virtual clock, which
+    only moves when told to, allows task sets to be simulated faster than real time or in real time
+    with a modeled cost for each run of each task.
+
+    Example of simulating two tasks on a computer:
+    @code
+        import hal
+        import cotask
+
+        clock = hal.VirtualClock()
+        hal.use(clock)          # Must be done before tasks are created
+        cotask.task_list.reset_idle()       # Restart CPU load measurement on the new clock
+
+        # Each run of task 1 takes 2 ms, each run of task 2 takes 5 ms
+        task1 = cotask.Task(clock.modeled(task1_fun, 2000), period=10)
+        task2 = cotask.Task(clock.modeled(task2_fun, 5000), period=50)
+        cotask.task_list.append(task1)
+        cotask.task_list.append(task2)
+
+        while clock.now < 10000000:          # Simulate 10 seconds
+            cotask.task_list.idle_sched()
+    @endcode
+
+@author Ben Elkayam
+@author Roey Mevorach
+@author Ermias Yemane
+
+@date   2026-Oct-17
+"""
+"""!
+@package utime              Contains tools for working with time-related operations.
+@package pyb                Contains all micro controller tools we use.
+@package micropython        Contains the code emitter decorators used by the scheduler.
+"""
+import time
+
+try:
+    import utime
+except ImportError:
+    utime = None
+
+try:
+    import pyb
+except ImportError:
+    pyb = None
+
+
+class _MicroPython:
+    '''!
+    @brief      Stand-in for the @c micropython module when running under CPython.
+    @details    The decorators leave functions unchanged, so code decorated with
+                @c micropython.native runs as ordinary Python.
+    '''
+
+    @staticmethod
+    def native(fun):
+        return fun
+
+    viper = native
+
+    @staticmethod
+    def const(value):
+        return value
+
+    @staticmethod
+    def alloc_emergency_exception_buf(size):
+        pass
+
+
+try:
+    import micropython
+except ImportError:
+    ## The @c micropython module, or a stand-in for it when it doesn't exist
+    micropython = _MicroPython()
+
+
+## Tick counts wrap around to zero at this value, as MicroPython's do
+TICKS_PERIOD = 1 << 30
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD // 2
+
+
+if utime is not None:
+    ticks_diff = utime.ticks_diff
+    ticks_add = utime.ticks_add
+else:
+    def ticks_diff(end, start):
+        '''!
+        @brief      Find the signed difference between two tick counts.
+        @details    This works as MicroPython's @c utime.ticks_diff() does, giving the right answer when
+                    the tick count has wrapped around as long as the times are less than half of
+                    @c TICKS_PERIOD apart.
+        @param      end The later tick count
+        @param      start The earlier tick count
+        @return     The number of ticks from @c start to @c end
+        '''
+        return ((end - start + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+    def ticks_add(ticks, delta):
+        '''!
+        @brief      Add a number of ticks to a tick count, wrapping around as MicroPython does.
+        @param      ticks A tick count
+        @param      delta The number of ticks, positive or negative, to add
+        @return     The new tick count
+        '''
+        return (ticks + delta) & _TICKS_MAX
+
+
+if pyb is not None:
+    disable_irq = pyb.disable_irq
+    enable_irq = pyb.enable_irq
+else:
+    def disable_irq():
+        '''!
+        @brief      Stand-in for @c pyb.disable_irq(); there are no interrupts to disable.
+        @return     The interrupt state to be given to @c enable_irq()
+        '''
+        return True
+
+    def enable_irq(state=True):
+        '''!
+        @brief      Stand-in for @c pyb.enable_irq(); there are no interrupts to enable.
+        @param      state The interrupt state returned by @c disable_irq()
+        '''
+        pass
+
+
+class BoardClock:
+    '''!
+    @brief      The clock used on a board running MicroPython.
+    @details    Times come from @c utime. Idling waits for the next interrupt with @c pyb.wfi(), which
+                returns within a millisecond as the system timer interrupts that often; where there is
+                no @c pyb module, such as on the Unix port of MicroPython, idling sleeps instead.
+    '''
+
+    def __init__(self):
+        '''!
+        @brief      Create a board clock object.
+        @param      self The object itself
+        '''
+        self.ticks_us = utime.ticks_us
+        self.ticks_ms = utime.ticks_ms
+
+    def idle(self, wait):
+        '''!
+        @brief      Wait until an interrupt occurs or a given time has passed.
+        @param      self The object itself
+        @param      wait The longest time to wait in microseconds
+        @return     None
+        '''
+        if pyb is not None:
+            pyb.wfi()
+        else:
+            utime.sleep_us(wait)
+
+
+class HostClock:
+    '''!
+    @brief      A clock for running tasks in real time on a computer under CPython.
+    @details    Times come from the computer's performance counter, counted from the creation of the
+                clock and wrapped around as MicroPython's tick counts are. Idling sleeps.
+    '''
+
+    def __init__(self):
+        '''!
+        @brief      Create a host clock object.
+        @param      self The object itself
+        '''
+        self._start = time.perf_counter_ns()
+
+    def ticks_us(self):
+        '''!
+        @brief      Get the time in microseconds since the clock was created.
+        @param      self The object itself
+        @return     A tick count in microseconds
+        '''
+        return ((time.perf_counter_ns() - self._start) // 1000) & _TICKS_MAX
+
+    def ticks_ms(self):
+        '''!
+        @brief      Get the time in milliseconds since the clock was created.
+        @param      self The object itself
+        @return     A tick count in milliseconds
+        '''
+        return ((time.perf_counter_ns() - self._start) // 1000000) & _TICKS_MAX
+
+    def idle(self, wait):
+        '''!
+        @brief      Sleep for a given time.
+        @param      self The object itself
+        @param      wait The time to sleep in microseconds
+        @return     None
+        '''
+        time.sleep(wait / 1000000.0)
+
+
+class VirtualClock:
+    '''!
+    @brief      A simulated clock which moves only when told to.
+    @details    Time stands still while tasks run unless their code, or a wrapper made by @c modeled(),
+                advances the clock by the time the work would take. Idling moves the clock straight to
+                the end of the idle time. When @c realtime is @c True, every advance of the clock also
+                sleeps for the same time, so that a simulation keeps pace with the real world;
+                otherwise the simulation runs as fast as the computer can run it.
+    '''
+
+    def __init__(self, realtime=False, start=0):
+        '''!
+        @brief      Create a virtual clock object.
+        @param      self The object itself
+        @param      realtime @c True to sleep for each advance of the clock
+        @param      start The time in microseconds at which the clock starts
+        '''
+        ## The total simulated time in microseconds, which does not wrap around
+        self.now = start
+        self.realtime = realtime
+
+    def ticks_us(self):
+        '''!
+        @brief      Get the simulated time in microseconds.
+        @param      self The object itself
+        @return     A tick count in microseconds
+        '''
+        return self.now & _TICKS_MAX
+
+    def ticks_ms(self):
+        '''!
+        @brief      Get the simulated time in milliseconds.
+        @param      self The object itself
+        @return     A tick count in milliseconds
+        '''
+        return (self.now // 1000) & _TICKS_MAX
+
+    def advance(self, delta):
+        '''!
+        @brief      Move the simulated time forward.
+        @param      self The object itself
+        @param      delta The time in microseconds by which to move the clock
+        @return     None
+        '''
+        if self.realtime:
+            time.sleep(delta / 1000000.0)
+        self.now += int(delta)
+
+    def idle(self, wait):
+        '''!
+        @brief      Let simulated time pass while the scheduler is idle.
+        @param      self The object itself
+        @param      wait The time to idle in microseconds
+        @return     None
+        '''
+        self.advance(wait)
+
+    def modeled(self, run_fun, cost):
+        '''!
+        @brief      Wrap a task function so that each of its runs takes a modeled time.
+        @details    The returned generator function can be given to @c cotask.Task in place of
+                    @c run_fun. Each time the task runs, the clock is advanced by the cost after the
+                    task's own code has run, so the scheduler measures the cost as the run time.
+        @param      self The object itself
+        @param      run_fun The task function, a generator function
+        @param      cost The time in microseconds taken by each run of the task, or a function
+                    called with no arguments which returns that time, for modeling run times
+                    which vary
+        @return     A generator function which runs @c run_fun and advances the clock
+        '''
+        clock = self
+
+        def run(*args):
+            gen = run_fun(*args)
+            sent = None
+            while True:
+                try:
+                    state = gen.send(sent)
+                except StopIteration:
+                    return
+                clock.advance(cost() if callable(cost) else cost)
+                sent = yield state
+
+        return run
+
+
+## The clock currently used by the scheduler
+clock = None
+
+
+def use(new_clock):
+    '''!
+    @brief      Choose the clock used by the scheduler and the task sharing code.
+    @details    This should be called before any tasks are created, as tasks read the clock when
+                they are created to find when they should first run. Times already read from the old
+                clock are not changed, so after changing clocks the idle time measurement of
+                @c cotask.task_list must be restarted with its @c reset_idle() method, and the
+                throughput statistics of any queues and shares already made with their
+                @c reset_stats() methods.
+    @param      new_clock A clock object such as a @c BoardClock, @c HostClock or @c VirtualClock
+    @return     The clock which was in use before
+    '''
+    global clock, ticks_us, ticks_ms, idle
+    old_clock = clock
+    clock = new_clock
+    ticks_us = new_clock.ticks_us
+    ticks_ms = new_clock.ticks_ms
+    idle = new_clock.idle
+    return old_clock
+
+
+use(BoardClock() if utime is not None else HostClock())
@@ -2,11 +2,12 @@
 @file main.py
     The code is for a control system for two motors. The system first initializes a USB-serial
     communication to receive inputs from the decoder, including the KP and setpoint values.
-    Then two motor objects, two encoder objects, and two controller objects are created using the
-    motor and encoder objects and the KP and setpoint values. Finally, two tasks are created to
-    control each motor using its corresponding controller object, and these tasks run in a cooperative
-    multitasking environment provided by the cotask module. The system streams data to the USB-serial
-    port and receives inputs from the same port.
+    Then two motor objects and two encoder objects are created, and a controller bank which controls
+    both motors is created using the motor and encoder objects and the KP and setpoint values. Finally,
+    one task is created to run the controller bank, and a second, low priority task sends the
+    controllers' data to the USB-serial port; these tasks run in a cooperative multitasking
+    environment provided by the cotask module. The system streams data to the USB-serial port and
+    receives inputs from the same port.
 
 @author Ben Elkayam
 @author Roey Mevorach
@@ -20,18 +21,31 @@
 @package cotask             Contains the class to run cooperatively scheduled tasks in amultitasking system.
 @package task_share         Contains the class that allows tasks to share data without the risk
                             of data corruption by interrupts.
+@package telemetry          Contains the buffer which sends the controllers' data without allocating memory.
 @package encoder_reader     Contains our encoder driver class and data.
 @package motor_driver       Contains our motor driver class that interfaces with the encoder.
-@package controller         Contains our controller class which combines the motor and encode classes.
+@package controller         Contains our controller bank class which combines the motor and encode classes.
 """
 import gc
 import pyb
 import cotask
 import task_share
+import telemetry
 from pyb import Pin as Pin
 from encoder_reader import Encoder
 from motor_driver import MotorDriver
-from controller import Controller
+from controller import ControllerBank
+
+## The period of the control task in milliseconds. Both motors are run by the
+#  one task at this period; the README's period sweep is reproduced by
+#  changing it. To run the motors at different periods, as the two control
+#  tasks once did, make one bank and one task for each motor
+CONTROL_PERIOD = 50
+
+## The largest duty cycle, in percent, which the controller bank sends to the
+#  motors. The old floating point proportional law passed its output to the
+#  motor driver unclamped; raise this limit to do the same
+OUTPUT_LIMIT = 100
 
 def get_inputs():
     """!
@@ -52,72 +66,77 @@ def get_inputs():
 
     return (kp, setpoint)
 
-def task1_fun(shares):
+def control_fun(shares):
     """!
-    @brief      This function executes task1 by continuously checking if the controller1 has new data and,
-                if so, writing it to the u2 share.
+    @brief      This function executes the control task, which runs the controller bank for every motor and
+                adds each motor's new data to the telemetry buffer.
     @details    The function takes in a tuple of two shares, one for the `my_share` and one for the `my_queue`.
-                It then enters a while loop that runs indefinitely, checking if the `controller1.run()` method
-                returns `True` and, if so, writing the first and second elements of `controller1.motor_data`
-                to the `u2` share. If a KeyboardInterrupt is raised, the motor is shut off and the loop is broken.
+                It then enters a while loop that runs indefinitely, passing `bank.run()` the time since the task
+                last ran, which the scheduler sends in at each `yield`, so the bank runs on every run of the task
+                and scales its rate terms by the actual elapsed time. If `bank.run()` returns `True`, it adds
+                the motor number, the bank's elapsed time and the position of each motor to `my_queue`, a
+                telemetry buffer from which the telemetry task sends it to the UART.
+                One run of this task updates every motor, so adding motors doesn't add tasks. The samples are
+                written into memory allocated in advance, so the control loop leaves no garbage to be
+                collected; if the buffer is full a sample is dropped, so the control loop never waits for the
+                UART. If a KeyboardInterrupt is raised, the motors are shut off and the loop is broken.
                 The function yields control after each iteration of the loop.
     @param      shares A tuple of two shares, one for `my_share` and one for `my_queue`.
     @return     None
     """
     # Get references to the share and queue which have been passed to this task
-    # my_share, my_queue = shares
+    my_share, my_queue = shares
+    positions = bank.positions
+    dt = None
 
     while 1:
         try:
-            if controller1.run():
-                u2.write(f"1 {controller1.motor_data[0]} {controller1.motor_data[1]}\r\n")
+            if bank.run(dt):
+                for axis in range(bank.count):
+                    my_queue.add(axis + 1, bank.elapsed, positions[axis])
 
         except KeyboardInterrupt:
-            motor1.set_duty_cycle(0)
-            print("motor shut off")
+            bank.stop()
+            print("motors shut off")
             break
 
-        yield
+        # The scheduler sends the time in microseconds since this task last ran
+        dt = yield
 
 
-def task2_fun(shares):
+def telemetry_fun(shares):
     """!
-    @brief      This function executes task2 by continuously checking if the controller2 has new data and,
-                if so, writing it to the u2 share.
+    @brief      This function executes the telemetry task, which sends the controllers' data to the UART.
     @details    The function takes in a tuple of two shares, one for the `my_share` and one for the `my_queue`.
-                It then enters a while loop that runs indefinitely, checking if the `controller2.run()` method
-                returns `True` and, if so, writing the first and second elements of `controller2.motor_data`
-                to the `u2` share. If a KeyboardInterrupt is raised, the motor is shut off and the loop is broken.
-                The function yields control after each iteration of the loop.
+                The task has no period; it is made ready to run whenever the control task adds a sample to
+                `my_queue`. Each time it runs, it sends every sample waiting in the buffer, already formatted
+                as lines of motor number, time and position, to the UART in one write. The total number of
+                samples sent is kept in `my_share`.
     @param      shares A tuple of two shares, one for `my_share` and one for `my_queue`.
     @return     None
     """
     # Get references to the share and queue which have been passed to this task
-    # my_share, my_queue = shares
+    my_share, my_queue = shares
+    sent = 0
 
     while 1:
-        try:
-            if controller2.run():
-                u2.write(f"2 {controller2.motor_data[0]} {controller2.motor_data[1]}\r\n")
-
-        except KeyboardInterrupt:
-            motor2.set_duty_cycle(0)
-            print("motor shut off")
-            break
+        count = my_queue.send(u2)
+        if count:
+            sent += count
+            my_share.put(sent)
 
         yield
 
 
-# This code creates a share, a queue, and two tasks, then starts the tasks. The
+# This code creates a share, a queue, and three tasks, then starts the tasks. The
 # tasks run until somebody presses ENTER, at which time the scheduler stops and
 # printouts show diagnostic information about the tasks, share, and queue.
 if __name__ == "__main__":
-    ## Create a share to test function and diagnostic printouts
-    share0 = task_share.Share('h', thread_protect=False, name="Share 0")
+    ## Create a share holding the number of samples sent by the telemetry task
+    share0 = task_share.Share('L', thread_protect=False, name="Sent")
 
-    ## Create a queue to test function and diagnostic printouts
-    q0 = task_share.Queue('L', 16, thread_protect=False, overwrite=False,
-                          name="Queue 0")
+    ## Create a buffer of (motor, time, position) samples for the telemetry task
+    q0 = telemetry.TelemetryBuffer(64, name="Telemetry")
 
     ## Set up the USB-serial port for streaming data
     u2 = pyb.UART(2, baudrate=115200)
@@ -142,38 +161,51 @@ if __name__ == "__main__":
     ## Inputs from decoder for controller2
     updated_params2 = get_inputs()
 
-    ## Once motor, encoder and params are collected they are used to create this controller 1 object
-    controller1 = Controller(updated_params1[0], updated_params1[1], motor1, encoder1)
-
-    ## Once motor, encoder and params are collected they are used to create this controller 2 object
-    controller2 = Controller(updated_params2[0], updated_params2[1], motor2, encoder2)
-
-
-    # Create the tasks. If trace is enabled for any task, memory will be
-    # allocated for state transition tracing, and the application will run out
-    # of memory after a while and quit. Therefore, use tracing only for 
-    # debugging and set trace to False when it's not needed
-    task1 = cotask.Task(task1_fun, name="Task_1", priority=1, period=50,
-                        profile=True, trace=False, shares=(share0, q0))
-    task2 = cotask.Task(task2_fun, name="Task_2", priority=1, period=250,
+    ## Once motors, encoders and params are collected they are used to create this controller bank,
+    #  which controls both motors in one pass
+    bank = ControllerBank([motor1, motor2], [encoder1, encoder2],
+                          [updated_params1[0], updated_params2[0]],
+                          [updated_params1[1], updated_params2[1]],
+                          period=CONTROL_PERIOD, limit=OUTPUT_LIMIT)
+
+
+    # Create the tasks. If trace is enabled for any task, a buffer holding
+    # that task's most recent state transitions is allocated when the task is
+    # created, so tracing can be left on without running out of memory
+    task1 = cotask.Task(control_fun, name="Control", priority=1,
+                        period=CONTROL_PERIOD,
+                        profile=True, trace=False, shares=(share0, q0),
+                        send_dt=True)
+
+    # The telemetry task has the lowest priority and no period; it runs
+    # whenever the control task has added a sample to the telemetry buffer
+    task2 = cotask.Task(telemetry_fun, name="Telemetry", priority=0,
                         profile=True, trace=False, shares=(share0, q0))
+    q0.add_waiter(task2)
 
     cotask.task_list.append(task1)
     cotask.task_list.append(task2)
 
+    # Stagger the tasks' run times so that they aren't all due at once
+    cotask.task_list.auto_phase()
+
     # Run the memory garbage collector to ensure memory is as defragmented as
     # possible before the real-time scheduler is started
     gc.collect()
+    cotask.task_list.reset_idle()
 
-    # Run the scheduler with the chosen scheduling algorithm. Quit if ^C pressed
+    # Run the scheduler with the chosen scheduling algorithm, sleeping until
+    # the next task is due rather than spinning. Quit if ^C pressed
     while True:
         try:
-            cotask.task_list.pri_sched()
+            cotask.task_list.idle_sched()
         except KeyboardInterrupt:
             break
 
     # Print a table of task data and a table of shared information data
     print('\n' + str (cotask.task_list))
+    print(cotask.task_list.percentiles())
+    print(cotask.task_list.schedulability())
     print(task_share.show_all())
     print(task1.get_trace())
     print('')
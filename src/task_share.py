@@ -24,8 +24,10 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import array
 import gc
-import pyb
-import micropython
+import struct
+import sys
+import hal
+from hal import micropython
 
 
 ## This is a system-wide list of all the queues and shared variables. It is
@@ -51,6 +53,16 @@ def show_all ():
     return '\n'.join (gen)
 
 
+def snapshot_all ():
+    """!
+    Get the statistics of every queue and share in the system in a form
+    which is easy for a program to use, such as to save as JSON.
+    @return A list holding the dictionary returned by @c stats() for each
+            queue and share
+    """
+    return [item.stats () for item in share_list]
+
+
 # ============================================================================
 
 class BaseShare:
@@ -71,10 +83,114 @@ class BaseShare:
         self._type_code = type_code
         self._thread_protect = thread_protect
 
+        # Tasks which are to be made ready to run when data is written
+        self._waiters = []
+
+        # Throughput statistics: items written and read, items thrown away,
+        # time spent waiting to put items, and the put rate estimate
+        self.reset_stats ()
+
         # Add this queue to the global share and queue list
         share_list.append (self)
 
 
+    def reset_stats (self):
+        """!
+        Clear the throughput statistics of this queue or share.
+        """
+        self._n_put = 0
+        self._n_got = 0
+        self._n_dropped = 0
+        self._blocked_us = 0
+        self._rate = 0.0
+        self._rate_count = 0
+        self._rate_time = hal.ticks_us ()
+
+
+    def rate (self, tau = 1.0):
+        """!
+        Estimate the rate at which items are being put in.
+
+        The estimate is a moving average which gives recent data more weight,
+        with older data decaying with a time constant @c tau. It's updated
+        each time this method is called, from the number of items put in 
+        since the last call, so it should be called every so often (for
+        example from a low priority task) for the estimate to follow changes.
+        @param tau The averaging time constant in seconds
+        @return The estimated number of items put in per second
+        """
+        now = hal.ticks_us ()
+        elapsed = hal.ticks_diff (now, self._rate_time)
+        if elapsed > 0:
+            count = self._n_put
+            inst = (count - self._rate_count) * 1000000.0 / elapsed
+            weight = elapsed / (tau * 1000000.0 + elapsed)
+            self._rate += weight * (inst - self._rate)
+            self._rate_count = count
+            self._rate_time = now
+        return self._rate
+
+
+    def stats (self):
+        """!
+        Get the throughput statistics of this queue or share.
+        @return A dictionary holding the name, kind, numbers of items put,
+                gotten and dropped, time in microseconds spent waiting to put
+                items, and estimated rate of putting items per second
+        """
+        return {'name': self._name, 'kind': type (self).__name__,
+                'put': self._n_put, 'got': self._n_got, 
+                'dropped': self._n_dropped, 'blocked_us': self._blocked_us,
+                'rate': self.rate ()}
+
+
+    def _stats_str (self):
+        """!
+        Put the throughput statistics into a short string for diagnostic
+        printouts.
+        """
+        return ' Put {:d} Got {:d} Dropped {:d} Rate {:.1f}/s'.format (
+            self._n_put, self._n_got, self._n_dropped, self.rate ())
+
+
+    def add_waiter (self, task):
+        """!
+        Have a task made ready to run whenever data is written into this 
+        queue or share.
+
+        The task's @c go() flag is set by each write, including writes from
+        an interrupt service routine, so a task created with a period of 
+        @c None runs only when there's new data rather than being polled:
+        @code
+        |   sender = cotask.Task (sender_fun, name="Sender", priority=0)
+        |   my_queue.add_waiter (sender)
+        @endcode
+        @param task The task to be made ready, a @c cotask.Task or any 
+               object with a @c go_flag attribute
+        """
+        if task not in self._waiters:
+            self._waiters.append (task)
+
+
+    def remove_waiter (self, task):
+        """!
+        Stop having a task made ready to run when data is written.
+        @param task A task which was given to @c add_waiter()
+        """
+        if task in self._waiters:
+            self._waiters.remove (task)
+
+
+    @micropython.native
+    def _wake (self):
+        """!
+        Make all the waiting tasks ready to run. This is safe to call from an
+        interrupt service routine, as it only sets flags.
+        """
+        for task in self._waiters:
+            task.go_flag = True
+
+
 # ============================================================================
 
 class Queue (BaseShare):
@@ -153,6 +269,9 @@ class Queue (BaseShare):
             self._buffer = None
             raise
 
+        # A view of the buffer through which blocks of data are copied
+        self._view = memoryview (self._buffer)
+
         # Initialize pointers to be used for reading and writing data
         self.clear ()
 
@@ -168,10 +287,11 @@ class Queue (BaseShare):
 
         If there isn't room for the item, wait (blocking the calling process)
         until room becomes available, unless the @c overwrite constructor
-        parameter was set to @c True to allow old data to be clobbered. If
-        non-blocking behavior without overwriting is needed, one should call
-        @c full() to ensure that the queue is not full before putting data
-        into it:
+        parameter was set to @c True to allow old data to be clobbered. 
+        Waiting here stops all the other tasks in a cooperative system, so
+        inside a task one should use @c try_put() or @c put_wait() instead, 
+        or call @c full() to ensure that the queue is not full before putting
+        data into it:
         @code
         |   def some_task ():
         |       # Setup
@@ -183,20 +303,32 @@ class Queue (BaseShare):
         @param item The item to be placed into the queue
         @param in_ISR Set this to @c True if calling from within an ISR
         """
-        # If we're in an ISR and the queue is full and we're not allowed to
-        # overwrite data, we have to give up and exit
+        # If we're in an ISR and the queue is full, we have to give up and
+        # exit, dropping the data
         if self.full ():
             if in_ISR:
+                self._n_dropped += 1
                 return
 
             # Wait (if needed) until there's room in the buffer for the data
             if not self._overwrite:
+                start = hal.ticks_us ()
                 while self.full ():
                     pass
+                self._blocked_us += hal.ticks_diff (hal.ticks_us (), start)
 
         # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
-            _irq_state = pyb.disable_irq ()
+            _irq_state = hal.disable_irq ()
+
+        # If the queue is full, the oldest item is being overwritten, so move
+        # the read pointer past it
+        if self._num_items >= self._size:
+            self._rd_idx += 1
+            if self._rd_idx >= self._size:
+                self._rd_idx = 0
+            self._num_items -= 1
+            self._n_dropped += 1
 
         # Write the data and advance the counts and pointers
         self._buffer[self._wr_idx] = item
@@ -204,14 +336,16 @@ class Queue (BaseShare):
         if self._wr_idx >= self._size:
             self._wr_idx = 0
         self._num_items += 1
-        if self._num_items >= self._size:        # Can't be fuller than full
-            self._num_items = self._size
+        self._n_put += 1
         if self._num_items > self._max_full:     # Record maximum fillage
             self._max_full = self._num_items
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
-            pyb.enable_irq (_irq_state)
+            hal.enable_irq (_irq_state)
+
+        if self._waiters:
+            self._wake ()
 
 
     @micropython.native
@@ -220,9 +354,11 @@ class Queue (BaseShare):
         Read an item from the queue.
 
         If there isn't anything in there, wait (blocking the calling process)
-        until something becomes available. If non-blocking reads are needed,
-        one should call @c any() to check for items before attempting to read
-        from the queue. This is usually done in a low priority task:
+        until something becomes available. Waiting here stops all the other
+        tasks in a cooperative system, so if non-blocking reads are needed,
+        one should use @c try_get() or @c get_wait(), or call @c any() to 
+        check for items before attempting to read from the queue. This is 
+        usually done in a low priority task:
         @code
         |   def some_task ():
         |       # Setup
@@ -241,7 +377,7 @@ class Queue (BaseShare):
 
         # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
-            irq_state = pyb.disable_irq ()
+            irq_state = hal.disable_irq ()
 
         # Get the item to be returned from the queue
         to_return = self._buffer[self._rd_idx]
@@ -253,14 +389,205 @@ class Queue (BaseShare):
         self._num_items -= 1
         if self._num_items < 0:
             self._num_items = 0
+        self._n_got += 1
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
-            pyb.enable_irq (irq_state)
+            hal.enable_irq (irq_state)
 
         return (to_return)
 
 
+    @micropython.native
+    def try_put (self, item, in_ISR = False):
+        """!
+        Put an item into the queue if there's room for it, without waiting.
+
+        If the queue is full and the @c overwrite constructor parameter was
+        set to @c True, the item is put in anyway and old data is clobbered.
+        @param item The item to be placed into the queue
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c True if the item was put into the queue, @c False if the
+                queue was full
+        """
+        if self.full () and not self._overwrite:
+            return False
+        self.put (item, in_ISR)
+        return True
+
+
+    @micropython.native
+    def try_get (self, default = None, in_ISR = False):
+        """!
+        Read an item from the queue if there is one, without waiting.
+        @param default The value to be returned if the queue is empty
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The item read from the queue, or @c default if the queue was
+                empty
+        """
+        if self.empty ():
+            return default
+        return self.get (in_ISR)
+
+
+    @micropython.native
+    def put_many (self, data, in_ISR = False):
+        """!
+        Put a block of items into the queue.
+
+        The items are copied into the queue's buffer in at most two pieces
+        (two if the block wraps around the end of the buffer), with
+        interrupts disabled once for the whole block if thread protection is
+        on. This method doesn't wait: if there isn't room for all the items,
+        only as many as fit are put in, unless the @c overwrite constructor
+        parameter was set to @c True, in which case the oldest data is 
+        clobbered to make room. 
+        @param data An @c array.array or @c memoryview holding items of the
+               same type as the queue
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items put into the queue
+        """
+        src = memoryview (data)
+        count = len (src)
+        start = 0
+
+        if self._thread_protect and not in_ISR:
+            irq_state = hal.disable_irq ()
+
+        # If there isn't room, either put in only what fits or make room by
+        # moving the read pointer past the oldest data
+        free = self._size - self._num_items
+        if count > free:
+            if self._overwrite:
+                if count > self._size:
+                    start = count - self._size
+                    count = self._size
+                dropped = count - free
+                self._rd_idx += dropped
+                if self._rd_idx >= self._size:
+                    self._rd_idx -= self._size
+                self._num_items -= dropped
+                self._n_dropped += dropped + start
+            else:
+                count = free
+
+        # Copy the data in one piece, or two if it wraps around
+        wr_idx = self._wr_idx
+        first = self._size - wr_idx
+        if first > count:
+            first = count
+        self._view[wr_idx:wr_idx + first] = src[start:start + first]
+        if count > first:
+            self._view[0:count - first] = src[start + first:start + count]
+        wr_idx += count
+        if wr_idx >= self._size:
+            wr_idx -= self._size
+        self._wr_idx = wr_idx
+        self._num_items += count
+        self._n_put += count
+        if self._num_items > self._max_full:
+            self._max_full = self._num_items
+
+        if self._thread_protect and not in_ISR:
+            hal.enable_irq (irq_state)
+
+        if self._waiters:
+            self._wake ()
+
+        return count
+
+
+    @micropython.native
+    def get_many (self, out, in_ISR = False):
+        """!
+        Read a block of items from the queue.
+
+        As many items as are in the queue, up to the size of @c out, are 
+        copied out in at most two pieces, with interrupts disabled once for 
+        the whole block if thread protection is on. This method doesn't wait
+        for items to be put into the queue. 
+        @param out An @c array.array or @c memoryview of the same type as the
+               queue, into which items are copied starting at its beginning
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items copied into @c out
+        """
+        dst = memoryview (out)
+
+        if self._thread_protect and not in_ISR:
+            irq_state = hal.disable_irq ()
+
+        count = self._num_items
+        if count > len (dst):
+            count = len (dst)
+
+        # Copy the data in one piece, or two if it wraps around
+        rd_idx = self._rd_idx
+        first = self._size - rd_idx
+        if first > count:
+            first = count
+        dst[0:first] = self._view[rd_idx:rd_idx + first]
+        if count > first:
+            dst[first:count] = self._view[0:count - first]
+        rd_idx += count
+        if rd_idx >= self._size:
+            rd_idx -= self._size
+        self._rd_idx = rd_idx
+        self._num_items -= count
+        self._n_got += count
+
+        if self._thread_protect and not in_ISR:
+            hal.enable_irq (irq_state)
+
+        return count
+
+
+    def put_wait (self, item, state = 0):
+        """!
+        Put an item into the queue, letting other tasks run while waiting for
+        room in the queue. 
+
+        This method is a generator to be used from within a task's generator
+        with @c yield @c from; each time the queue is found to be full, it
+        yields @c state to the scheduler so other tasks, such as the one 
+        which empties the queue, can run:
+        @code
+        |   def producer_task ():
+        |       while True:
+        |           yield from my_queue.put_wait (create_something_to_put ())
+        |           yield 0
+        @endcode
+        @param item The item to be placed into the queue
+        @param state The state to be yielded to the scheduler while waiting
+        """
+        while self.full () and not self._overwrite:
+            yield state
+        self.put (item)
+
+
+    def get_wait (self, state = 0):
+        """!
+        Read an item from the queue, letting other tasks run while waiting for
+        something to be put into the queue.
+
+        This method is a generator to be used from within a task's generator
+        with @c yield @c from; each time the queue is found to be empty, it
+        yields @c state to the scheduler so other tasks can run. The item read
+        is the value of the @c yield @c from expression:
+        @code
+        |   def consumer_task ():
+        |       while True:
+        |           something = yield from my_queue.get_wait ()
+        |           do_something_with (something)
+        |           yield 0
+        @endcode
+        @param state The state to be yielded to the scheduler while waiting
+        @return The item read from the queue
+        """
+        while self.empty ():
+            yield state
+        return self.get ()
+
+
     @micropython.native
     def any (self):
         """!
@@ -327,7 +654,616 @@ class Queue (BaseShare):
         items and queue size. 
         """
         return ('{:<12s} Queue<{:s}> Max Full {:d}/{:d}'.format (self._name,
-                type_code_strings[self._type_code], self._max_full, self._size))
+                type_code_strings[self._type_code], self._max_full, self._size)
+                + self._stats_str ())
+
+
+# ============================================================================
+
+class SPSCQueue (BaseShare):
+    """!
+    A queue for one producer and one consumer which never disables interrupts.
+
+    This queue is meant for passing data from one interrupt service routine
+    or task to one other task, such as from an encoder or timer interrupt to
+    a controller task. Only the producer changes the write index and only 
+    the consumer changes the read index, and the number of items is worked
+    out from the two indices rather than kept in a counter which both sides
+    would change. Each side writes only its own index, and only after the
+    data has been copied, so neither side can see the other half-finished
+    and there's no need to disable interrupts. The buffer has one more slot
+    than the queue's size so that a full queue can be told apart from an
+    empty one. 
+
+    If there is more than one producer or more than one consumer, use 
+    @c Queue with thread protection instead.
+
+    @code
+    import task_share
+
+    # In setup code, create a queue of 32-bit integers
+    enc_queue = task_share.SPSCQueue ('l', 64, name="Encoder")
+
+    # In an interrupt callback, the producer
+    def enc_callback (timer):
+        enc_queue.put (timer.counter ())
+
+    # In a task, the consumer
+    if enc_queue.any ():
+        count = enc_queue.get ()
+    @endcode
+    """
+    ## A counter used to give serial numbers to queues for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, type_code, size, name = None):
+        """!
+        Initialize a single-producer, single-consumer queue.
+
+        The data type is specified by a one-letter type code which is given as
+        for the Python @c array.array type; see @c Queue for a list. 
+        @param type_code The type of data items which the queue can hold
+        @param size The maximum number of items which the queue can hold
+        @param name A short name for the queue, default @c SPSCN where @c N
+               is a serial number for the queue
+        """
+        super ().__init__ (type_code, False, name)
+
+        self._size = size
+        self._slots = size + 1
+        self._name = str (name) if name != None \
+            else 'SPSC' + str (SPSCQueue.ser_num)
+        SPSCQueue.ser_num += 1
+
+        self._buffer = array.array (type_code, range (self._slots))
+        self.clear ()
+        gc.collect ()
+
+
+    @micropython.native
+    def put (self, item, in_ISR = False):
+        """!
+        Put an item into the queue if there's room; this is only to be called
+        by the producer. The item is never waited for or overwritten.
+        @param item The item to be placed into the queue
+        @param in_ISR Accepted so this queue can be used in place of a
+               @c Queue; interrupts are never disabled either way
+        @return @c True if the item was put in, @c False if the queue was full
+        """
+        wr_idx = self._wr_idx
+        nxt = wr_idx + 1
+        if nxt >= self._slots:
+            nxt = 0
+        if nxt == self._rd_idx:
+            self._n_dropped += 1
+            return False
+
+        # Write the data before moving the index which makes it visible
+        self._buffer[wr_idx] = item
+        self._wr_idx = nxt
+        self._n_put += 1
+
+        num = nxt - self._rd_idx
+        if num < 0:
+            num += self._slots
+        if num > self._max_full:
+            self._max_full = num
+        if self._waiters:
+            self._wake ()
+        return True
+
+
+    @micropython.native
+    def get (self, in_ISR = False, default = None):
+        """!
+        Read an item from the queue if there is one; this is only to be 
+        called by the consumer. The parameters are in the same order as 
+        those of @c Queue.get(), so that @c get(True) in an ISR works as it
+        does for a @c Queue.
+        @param in_ISR Accepted so this queue can be used in place of a
+               @c Queue; interrupts are never disabled either way
+        @param default The value to be returned if the queue is empty
+        @return The item read from the queue, or @c default if it was empty
+        """
+        rd_idx = self._rd_idx
+        if rd_idx == self._wr_idx:
+            return default
+
+        # Read the data before moving the index which frees its slot
+        to_return = self._buffer[rd_idx]
+        rd_idx += 1
+        if rd_idx >= self._slots:
+            rd_idx = 0
+        self._rd_idx = rd_idx
+        self._n_got += 1
+        return to_return
+
+
+    @micropython.native
+    def any (self):
+        """!
+        Check if there are any items in the queue.
+        @return @c True if items are in the queue, @c False if not
+        """
+        return self._rd_idx != self._wr_idx
+
+
+    @micropython.native
+    def empty (self):
+        """!
+        Check if the queue is empty.
+        @return @c True if queue is empty, @c False if it's not empty
+        """
+        return self._rd_idx == self._wr_idx
+
+
+    @micropython.native
+    def full (self):
+        """!
+        Check if the queue is full.
+        @return @c True if the queue is full
+        """
+        nxt = self._wr_idx + 1
+        if nxt >= self._slots:
+            nxt = 0
+        return nxt == self._rd_idx
+
+
+    @micropython.native
+    def num_in (self):
+        """!
+        Check how many items are in the queue. If the other side is using
+        the queue at the same time, the number may be out of date by the time
+        it's returned, but it is never more than the producer has put in.
+        @return The number of items in the queue
+        """
+        num = self._wr_idx - self._rd_idx
+        if num < 0:
+            num += self._slots
+        return num
+
+
+    def clear (self):
+        """!
+        Remove all contents from the queue. This should only be done when
+        neither the producer nor the consumer is using the queue.
+        """
+        self._rd_idx = 0
+        self._wr_idx = 0
+        self._max_full = 0
+
+
+    def __repr__ (self):
+        """!
+        This method puts diagnostic information about the queue into a string.
+        """
+        return ('{:<12s} SPSCQueue<{:s}> Max Full {:d}/{:d}'.format (
+                self._name, type_code_strings[self._type_code], 
+                self._max_full, self._size) + self._stats_str ())
+
+
+# ============================================================================
+
+class RecordQueue (BaseShare):
+    """!
+    A queue which carries records made of several fields of data.
+
+    Each record is packed into a slot in one preallocated @c bytearray
+    according to a format string as used by the @c struct module, so a
+    sample such as (time, position, duty cycle) can be passed as one item
+    rather than through several queues. A record is written or read all at
+    once, with interrupts disabled if thread protection is on. Because the
+    records are kept in packed binary form, blocks of them can be sent out
+    of a UART without copying by using @c peek_block() and @c release().
+
+    @code
+    import task_share
+
+    # Records of unsigned 32-bit time, signed 32-bit position, 16-bit duty
+    samples = task_share.RecordQueue ('<Llh', 100, name="Samples")
+
+    # In the task which makes data
+    samples.put (time, position, duty)
+
+    # In the task which sends the data, send the raw records
+    block = samples.peek_block ()
+    if block:
+        uart.write (block)
+        samples.release (len (block) // samples.record_size)
+    @endcode
+
+    @c put() takes its values as separate arguments and @c get() returns a
+    new tuple, and on MicroPython both of these make objects on the heap. 
+    Code which must not allocate memory, such as a control loop or an 
+    interrupt service routine, should use @c put_from() and 
+    @c unpack_into() instead, which copy the fields to and from an array 
+    made in advance:
+    @code
+    record = array.array ('l', [0, 0, 0])      # Made once, at startup
+
+    # In the task which makes data
+    record[0] = time
+    record[1] = position
+    record[2] = duty
+    samples.put_from (record)
+
+    # In the task which uses the data
+    if samples.unpack_into (record):
+        time, position, duty = record[0], record[1], record[2]
+    @endcode
+    """
+    ## A counter used to give serial numbers to queues for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, fmt, size, thread_protect = False, overwrite = False,
+                  name = None):
+        """!
+        Initialize a record queue, allocating memory for all its records.
+        @param fmt A @c struct format string describing the fields of each
+               record, such as @c '<Llh'
+        @param size The maximum number of records which the queue can hold
+        @param thread_protect @c True if mutual exclusion protection is used
+        @param overwrite If @c True, the oldest record will be overwritten by
+               a new one if the queue is full
+        @param name A short name for the queue, default @c RecordsN where 
+               @c N is a serial number for the queue
+        """
+        super ().__init__ (fmt, thread_protect, name)
+
+        ## The number of bytes in each packed record
+        self.record_size = struct.calcsize (fmt)
+
+        self._size = size
+        self._overwrite = overwrite
+        self._name = str (name) if name != None \
+            else 'Records' + str (RecordQueue.ser_num)
+        RecordQueue.ser_num += 1
+
+        self._buffer = bytearray (size * self.record_size)
+        self._view = memoryview (self._buffer)
+        self._parse_fields (fmt)
+        self.clear ()
+        gc.collect ()
+
+
+    def _parse_fields (self, fmt):
+        """!
+        Find the format, place in the record, size and signedness of each
+        field, so that fields can be packed and unpacked one at a time by
+        @c put_from() and @c unpack_into() without making a tuple.
+        @param fmt The @c struct format string of the records
+        """
+        prefix = ''
+        if fmt and fmt[0] in '@=<>!':
+            prefix = fmt[0]
+            fmt = fmt[1:]
+        if prefix == '<':
+            self._little = True
+        elif prefix == '>' or prefix == '!':
+            self._little = False
+        else:
+            self._little = sys.byteorder == 'little'
+
+        self._field_fmts = []
+        self._field_offsets = []
+        self._field_sizes = []
+        self._field_signed = []
+        self._field_float = []
+        self._fields_ok = True
+        so_far = prefix
+        count = ''
+        for code in fmt:
+            if code.isdigit ():
+                count += code
+                continue
+            num = int (count) if count else 1
+            count = ''
+            if code in 'xsp':
+                so_far += str (num) + code
+                if code != 'x':
+                    self._fields_ok = False
+                continue
+            for _ in range (num):
+                so_far += code
+                size = struct.calcsize (prefix + code)
+                self._field_fmts.append (prefix + code)
+                self._field_offsets.append (struct.calcsize (so_far) - size)
+                self._field_sizes.append (size)
+                self._field_signed.append (code in 'bhilq')
+                self._field_float.append (code in 'efd')
+        self._n_fields = len (self._field_fmts)
+
+
+    @micropython.native
+    def _claim (self):
+        """!
+        Find the place in the buffer for a new record, making room by 
+        clobbering the oldest record if the queue is full and overwriting is
+        allowed. Interrupts must be disabled by the caller if needed.
+        @return The index in the buffer of the new record's first byte, or 
+                -1 if the queue is full and the record must be dropped
+        """
+        if self._num_items >= self._size:
+            self._n_dropped += 1
+            if not self._overwrite:
+                return -1
+            self._rd_idx += 1
+            if self._rd_idx >= self._size:
+                self._rd_idx = 0
+            self._num_items -= 1
+        return self._wr_idx * self.record_size
+
+
+    @micropython.native
+    def _commit (self):
+        """!
+        Count a record which has been packed into the place found by 
+        @c _claim() as being in the queue.
+        """
+        self._wr_idx += 1
+        if self._wr_idx >= self._size:
+            self._wr_idx = 0
+        self._num_items += 1
+        self._n_put += 1
+        if self._num_items > self._max_full:
+            self._max_full = self._num_items
+
+
+    def put (self, *values, in_ISR = False):
+        """!
+        Put one record into the queue if there's room for it.
+
+        This method doesn't wait for room in the queue; if it's full, the
+        record is dropped, unless the @c overwrite constructor parameter was
+        set to @c True, in which case the oldest record is clobbered. 
+        @param values The values of the record's fields, in the order given
+               by the format string
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c True if the record was put in, @c False if it was dropped
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = hal.disable_irq ()
+
+        start = self._claim ()
+        if start >= 0:
+            struct.pack_into (self._type_code, self._buffer, start, *values)
+            self._commit ()
+
+        if self._thread_protect and not in_ISR:
+            hal.enable_irq (irq_state)
+
+        if start >= 0 and self._waiters:
+            self._wake ()
+
+        return start >= 0
+
+
+    @micropython.native
+    def put_from (self, values, in_ISR = False):
+        """!
+        Put one record into the queue from a sequence of field values, 
+        without allocating memory.
+
+        The fields are packed one at a time from @c values, which should be
+        an @c array.array or list made once and filled in before each call,
+        so no argument tuple is made as it is by @c put(). Records whose 
+        format has string or Pascal string fields can't be put this way.
+        Full queues are handled as by @c put().
+        @param values A sequence holding the values of the record's fields,
+               in the order given by the format string
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c True if the record was put in, @c False if it was dropped
+        """
+        if not self._fields_ok:
+            raise ValueError ('put_from() needs a format with only numbers')
+
+        if self._thread_protect and not in_ISR:
+            irq_state = hal.disable_irq ()
+
+        start = self._claim ()
+        if start >= 0:
+            buf = self._buffer
+            fmts = self._field_fmts
+            offsets = self._field_offsets
+            for idx in range (self._n_fields):
+                struct.pack_into (fmts[idx], buf, start + offsets[idx],
+                                  values[idx])
+            self._commit ()
+
+        if self._thread_protect and not in_ISR:
+            hal.enable_irq (irq_state)
+
+        if start >= 0 and self._waiters:
+            self._wake ()
+
+        return start >= 0
+
+
+    @micropython.native
+    def get (self, in_ISR = False):
+        """!
+        Read one record from the queue, without waiting if it's empty.
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return A tuple of the record's field values, or @c None if the 
+                queue is empty
+        """
+        if self._num_items <= 0:
+            return None
+
+        if self._thread_protect and not in_ISR:
+            irq_state = hal.disable_irq ()
+
+        to_return = struct.unpack_from (self._type_code, self._buffer,
+                                        self._rd_idx * self.record_size)
+        self._rd_idx += 1
+        if self._rd_idx >= self._size:
+            self._rd_idx = 0
+        self._num_items -= 1
+        self._n_got += 1
+
+        if self._thread_protect and not in_ISR:
+            hal.enable_irq (irq_state)
+
+        return to_return
+
+
+    @micropython.native
+    def unpack_into (self, out, in_ISR = False):
+        """!
+        Read one record from the queue into a sequence, without waiting if 
+        it's empty and without allocating memory for integer fields.
+
+        Integer fields are put together from the record's bytes, so no 
+        tuple is made as it is by @c get(). Values of 2 ** 30 or more in 
+        size, and floating point values, are still new objects on 
+        MicroPython's heap.
+        @param out A sequence such as an @c array.array or list, made once,
+               with room for all the record's fields
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c True if a record was read, @c False if the queue is empty
+        """
+        if not self._fields_ok:
+            raise ValueError ('unpack_into() needs a format with only numbers')
+        if self._num_items <= 0:
+            return False
+
+        if self._thread_protect and not in_ISR:
+            irq_state = hal.disable_irq ()
+
+        buf = self._buffer
+        start = self._rd_idx * self.record_size
+        little = self._little
+        offsets = self._field_offsets
+        sizes = self._field_sizes
+        signed = self._field_signed
+        for idx in range (self._n_fields):
+            if self._field_float[idx]:
+                out[idx] = struct.unpack_from (self._field_fmts[idx], buf, 
+                                               start + offsets[idx])[0]
+                continue
+
+            # Put the integer together starting with its most significant
+            # byte, which holds the sign
+            first = start + offsets[idx]
+            size = sizes[idx]
+            if little:
+                pos = first + size - 1
+                step = -1
+            else:
+                pos = first
+                step = 1
+            value = buf[pos]
+            if signed[idx] and value >= 128:
+                value -= 256
+            for _ in range (size - 1):
+                pos += step
+                value = (value << 8) | buf[pos]
+            out[idx] = value
+
+        self._rd_idx += 1
+        if self._rd_idx >= self._size:
+            self._rd_idx = 0
+        self._num_items -= 1
+        self._n_got += 1
+
+        if self._thread_protect and not in_ISR:
+            hal.enable_irq (irq_state)
+
+        return True
+
+
+    def peek_block (self):
+        """!
+        Get a view of the oldest records in the queue without copying them.
+
+        The view covers as many of the oldest records as are stored one after
+        another in the buffer; if the records wrap around the end of the 
+        buffer, the rest can be had by calling this method again after 
+        @c release(). The records stay in the queue until @c release() is
+        called, so they must not be overwritten while in use; this is only 
+        a risk if the queue was created with @c overwrite set to @c True.
+        @return A @c memoryview of the packed records, which may be empty
+        """
+        count = self._size - self._rd_idx
+        if count > self._num_items:
+            count = self._num_items
+        start = self._rd_idx * self.record_size
+        return self._view[start:start + count * self.record_size]
+
+
+    def release (self, count):
+        """!
+        Remove records which have been used through @c peek_block().
+        @param count The number of records to remove
+        """
+        if self._thread_protect:
+            irq_state = hal.disable_irq ()
+
+        if count > self._num_items:
+            count = self._num_items
+        self._rd_idx += count
+        if self._rd_idx >= self._size:
+            self._rd_idx -= self._size
+        self._num_items -= count
+        self._n_got += count
+
+        if self._thread_protect:
+            hal.enable_irq (irq_state)
+
+
+    @micropython.native
+    def any (self):
+        """!
+        Check if there are any records in the queue.
+        @return @c True if records are in the queue, @c False if not
+        """
+        return (self._num_items > 0)
+
+
+    @micropython.native
+    def empty (self):
+        """!
+        Check if the queue is empty.
+        @return @c True if queue is empty, @c False if it's not empty
+        """
+        return (self._num_items <= 0)
+
+
+    @micropython.native
+    def full (self):
+        """!
+        Check if the queue is full.
+        @return @c True if the queue is full
+        """
+        return (self._num_items >= self._size)
+
+
+    @micropython.native
+    def num_in (self):
+        """!
+        Check how many records are in the queue.
+        @return The number of records in the queue
+        """
+        return (self._num_items)
+
+
+    def clear (self):
+        """!
+        Remove all contents from the queue.
+        """
+        self._rd_idx = 0
+        self._wr_idx = 0
+        self._num_items = 0
+        self._max_full = 0
+
+
+    def __repr__ (self):
+        """!
+        This method puts diagnostic information about the queue into a string.
+        """
+        return ('{:<12s} RecordQueue<{:s}> Max Full {:d}/{:d}'.format (
+                self._name, self._type_code, self._max_full, self._size)
+                + self._stats_str ())
 
 
 # ============================================================================
@@ -408,13 +1344,17 @@ class Share (BaseShare):
 
         # Disable interrupts before writing the data
         if self._thread_protect and not in_ISR:
-            irq_state = pyb.disable_irq ()
+            irq_state = hal.disable_irq ()
 
         self._buffer[0] = data
+        self._n_put += 1
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
-            pyb.enable_irq (irq_state)
+            hal.enable_irq (irq_state)
+
+        if self._waiters:
+            self._wake ()
 
 
     @micropython.native
@@ -429,13 +1369,14 @@ class Share (BaseShare):
         """
         # Disable interrupts before reading the data
         if self._thread_protect and not in_ISR:
-            irq_state = pyb.disable_irq ()
+            irq_state = hal.disable_irq ()
 
         to_return = self._buffer[0]
+        self._n_got += 1
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
-            pyb.enable_irq (irq_state)
+            hal.enable_irq (irq_state)
 
         return (to_return)
 
@@ -447,6 +1388,324 @@ class Share (BaseShare):
         Shares are pretty simple, so we just put the name and type. 
         """
         return ("{:<12s} Share<{:s}>".format (self._name,
-                type_code_strings[self._type_code]))
+                type_code_strings[self._type_code]) + self._stats_str ())
+
+
+
+
+# ============================================================================
+
+class VersionedShare (BaseShare):
+    """!
+    A share holding one or more values which can be read without disabling
+    interrupts.
+
+    The writer adds one to a sequence number before and after changing the
+    data, so the number is odd while a write is in progress. A reader notes
+    the number, copies the data, and checks the number again; if a write was
+    in progress or happened while the data was being copied, the reader
+    tries again. Readers therefore always get a consistent snapshot of all
+    the values, such as a controller's setpoint and gains, without ever 
+    disabling interrupts, which is good when many tasks poll the same data
+    but it changes rarely. There may be only one writer, which may be an 
+    interrupt service routine or a task.
+
+    @code
+    import task_share
+
+    # Setpoint, proportional gain and integral gain as floats
+    params = task_share.VersionedShare ('f', 3, name="Params")
+
+    # In the task which changes the parameters
+    params.put_all ((setpoint, kp, ki))
+
+    # In each task which uses them, copying into a preallocated array
+    if params.read_into (my_params):
+        setpoint, kp, ki = my_params
+    @endcode
+    """
+    ## A counter used to give serial numbers to shares for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, type_code, size = 1, name = None):
+        """!
+        Create a versioned share, allocating memory for its values.
+
+        The data type is specified by a one-letter type code which is given as
+        for the Python @c array.array type; see @c Share for a list. 
+        @param type_code The type of the data items which the share holds
+        @param size The number of data items held, default 1
+        @param name A short name for the share, default @c VShareN where 
+               @c N is a serial number for the share
+        """
+        super ().__init__ (type_code, False, name)
+
+        self._size = size
+        self._buffer = array.array (type_code, (0 for _ in range (size)))
+        self._seq = 0
+
+        self._name = str (name) if name != None \
+            else 'VShare' + str (VersionedShare.ser_num)
+        VersionedShare.ser_num += 1
+
+
+    @micropython.native
+    def put (self, data, in_ISR = False, index = 0):
+        """!
+        Write one data item into the share. Only the one writer may call this.
+        The parameters are in the same order as those of @c Share.put(), so 
+        that @c put(data, True) from an ISR still writes the first item.
+        @param data The data to be put into the share
+        @param in_ISR Accepted so this share can be used in place of a 
+               @c Share; interrupts are never disabled either way
+        @param index The index of the item to be written, default 0
+        """
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+        self._buffer[index] = data
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+        self._n_put += 1
+        if self._waiters:
+            self._wake ()
+
+
+    @micropython.native
+    def put_all (self, values, in_ISR = False):
+        """!
+        Write all the data items in the share at once, so that readers see
+        either all the old values or all the new ones. Only the one writer
+        may call this.
+        @param values A sequence holding a value for each item in the share
+        @param in_ISR Accepted so this share can be used in place of a 
+               @c Share; interrupts are never disabled either way
+        """
+        buf = self._buffer
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+        for idx in range (self._size):
+            buf[idx] = values[idx]
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+        self._n_put += 1
+        if self._waiters:
+            self._wake ()
+
+
+    @micropython.native
+    def get (self, in_ISR = False, index = 0):
+        """!
+        Read one data item from the share. A single item is always read
+        whole, so there is no need to check for a write in progress. As for
+        @c put(), @c in_ISR comes first as it does for @c Share.get().
+        @param in_ISR Accepted so this share can be used in place of a 
+               @c Share
+        @param index The index of the item to be read, default 0
+        @return The data item
+        """
+        return self._buffer[index]
+
+
+    @micropython.native
+    def read_into (self, out, in_ISR = False):
+        """!
+        Copy all the data items in the share into a sequence such as an 
+        @c array.array, trying again until a copy is made which wasn't
+        disturbed by a write.
+
+        An interrupt service routine which might have interrupted the writer
+        while it was writing must not wait for the writer to finish, as it
+        never would; if @c in_ISR is @c True, this method gives up instead of
+        trying again.
+        @param out A sequence with room for all the items in the share
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c True if a consistent copy was made, @c False if not 
+        """
+        buf = self._buffer
+        while True:
+            seq = self._seq
+            if not seq & 1:
+                for idx in range (self._size):
+                    out[idx] = buf[idx]
+                if self._seq == seq:
+                    self._n_got += 1
+                    return True
+            if in_ISR:
+                return False
+
+
+    @micropython.native
+    def version (self):
+        """!
+        Get the share's sequence number, which changes each time the share is
+        written. Comparing it with a number saved earlier is a cheap way for a
+        reader to find out if there's new data.
+        @return The sequence number
+        """
+        return self._seq
 
 
+    def __repr__ (self):
+        """!
+        Puts diagnostic information about the share into a string.
+        """
+        return ("{:<12s} VersionedShare<{:s}>[{:d}] Version {:d}".format (
+                self._name, type_code_strings[self._type_code], self._size,
+                self._seq) + self._stats_str ())
+
+
+# ============================================================================
+
+class DoubleBuffer (BaseShare):
+    """!
+    A pair of buffers for handing whole blocks of data from one producer to
+    one consumer.
+
+    The producer, which may be a task or an interrupt service routine, puts
+    items into one buffer while the consumer works on the other. When the
+    producer's buffer is full, and the consumer has released the other one,
+    the buffers swap roles; no locking is needed for each item, and the 
+    consumer gets a whole block at a time, which suits sending data out of a
+    UART in large writes. If the consumer hasn't released its buffer when 
+    the producer's buffer fills, the producer's block is thrown away and 
+    counted in @c dropped so that lost data can be detected. 
+
+    @code
+    import task_share
+
+    telemetry = task_share.DoubleBuffer ('l', 64, name="Telemetry")
+
+    # In the producer
+    telemetry.put (position)
+
+    # In the consumer
+    block = telemetry.get_block ()
+    if block is not None:
+        uart.write (block)
+        telemetry.release ()
+    @endcode
+    """
+    ## A counter used to give serial numbers to buffers for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, type_code, size, name = None):
+        """!
+        Create a double buffer, allocating memory for both buffers.
+
+        The data type is specified by a one-letter type code which is given as
+        for the Python @c array.array type; see @c Queue for a list. 
+        @param type_code The type of the data items in the buffers
+        @param size The number of items in each buffer
+        @param name A short name for the buffer, default @c DBufN where @c N
+               is a serial number for the buffer
+        """
+        super ().__init__ (type_code, False, name)
+
+        self._size = size
+        self._bufs = (array.array (type_code, range (size)),
+                      array.array (type_code, range (size)))
+        self._views = (memoryview (self._bufs[0]), memoryview (self._bufs[1]))
+
+        self._name = str (name) if name != None \
+            else 'DBuf' + str (DoubleBuffer.ser_num)
+        DoubleBuffer.ser_num += 1
+
+        # The buffer being filled, how many items are in it, and the buffer
+        # (and its length) handed to the consumer. The producer only sets
+        # _ready when it is False and the consumer only clears it when True
+        self._fill = 0
+        self._fill_count = 0
+        self._ready = False
+        self._ready_idx = 1
+        self._ready_len = 0
+
+        ## The number of times the buffers have been swapped
+        self.swaps = 0
+
+        ## The number of items thrown away because the consumer hadn't 
+        #  released its buffer when the producer's buffer was full
+        self.dropped = 0
+
+        gc.collect ()
+
+
+    @micropython.native
+    def put (self, item, in_ISR = False):
+        """!
+        Put an item into the producer's buffer, swapping buffers if it
+        becomes full. Only the producer may call this.
+        @param item The item to be put into the buffer
+        @param in_ISR Accepted so this buffer can be used in place of a 
+               @c Queue; interrupts are never disabled either way
+        """
+        count = self._fill_count
+        self._bufs[self._fill][count] = item
+        self._n_put += 1
+        count += 1
+        self._fill_count = count
+        if count >= self._size:
+            self.flush ()
+
+
+    @micropython.native
+    def flush (self):
+        """!
+        Hand the producer's buffer to the consumer now, even if it isn't full,
+        if the consumer has released its buffer. If the producer's buffer is
+        full and can't be handed over, its contents are dropped. Only the 
+        producer may call this.
+        @return @c True if the buffers were swapped
+        """
+        count = self._fill_count
+        if count == 0:
+            return False
+        if self._ready:
+            if count >= self._size:
+                self.dropped += count
+                self._n_dropped += count
+                self._fill_count = 0
+            return False
+
+        # Describe the block before making it visible to the consumer
+        self._ready_idx = self._fill
+        self._ready_len = count
+        self._fill ^= 1
+        self._fill_count = 0
+        self.swaps += 1
+        self._ready = True
+        if self._waiters:
+            self._wake ()
+        return True
+
+
+    def get_block (self):
+        """!
+        Get the block of data which the producer has handed over, if any. 
+        Only the consumer may call this.
+        @return A @c memoryview of the items in the block, or @c None if no
+                block is ready. The block belongs to the consumer until 
+                @c release() is called
+        """
+        if not self._ready:
+            return None
+        view = self._views[self._ready_idx]
+        if self._ready_len < self._size:
+            return view[:self._ready_len]
+        return view
+
+
+    @micropython.native
+    def release (self):
+        """!
+        Give the consumer's buffer back so the producer can fill it again.
+        Only the consumer may call this.
+        """
+        if self._ready:
+            self._n_got += self._ready_len
+        self._ready = False
+
+
+    def __repr__ (self):
+        """!
+        Puts diagnostic information about the buffer into a string.
+        """
+        return ("{:<12s} DoubleBuffer<{:s}> 2x{:d} Swaps {:d} Dropped {:d}"
+                .format (self._name, type_code_strings[self._type_code],
+                         self._size, self.swaps, self.dropped)
+                + self._stats_str ())
@@ -0,0 +1,288 @@
+"""!
+@file telemetry.py
+    This file contains a buffer which collects the controllers' samples of motor number, time and
+    position and sends them to a serial port without allocating memory. Each sample is written
+    straight into a bytearray made when the buffer is created, either as a line of text or as a
+    packed binary record, and the whole batch is sent in one write through a memoryview which was
+    also made in advance. Nothing is left behind for the garbage collector, so a collection, and the
+    pause it causes, doesn't happen in the middle of a control cycle.
+
+    Text lines have fixed-width, zero-padded fields separated by single spaces, such as
+    @c "1 0000012340 -000004096\r\n", so that @c motor_decoder.py reads them as before. Binary
+    records are packed with @c struct in the format @c BINARY_FORMAT.
+
+    This file also contains a check to be run from the REPL on the board which counts the heap
+    memory used by a number of control cycles and asserts that it is zero. After @c main.py has been
+    stopped with ^C, its controller bank can be checked with:
+    @code
+        import telemetry
+        telemetry.check_control_cycles(bank, cycles=100)
+    @endcode
+
+@author Ben Elkayam
+@author Roey Mevorach
+@author Ermias Yemane
+
+@date   2026-Oct-17
+"""
+"""!
+@package gc                 Contains a garbage collector tool.
+@package struct             Contains tools to pack numbers into binary records.
+@package hal                Contains the clocks and the micropython module or a stand-in for it.
+@package task_share         Contains the class that allows tasks to share data without the risk
+                            of data corruption by interrupts.
+"""
+import gc
+import struct
+import task_share
+from hal import micropython
+
+## The layout of a text line; the fields are filled in for each sample
+ASCII_LINE = b'0 0000000000 0000000000\r\n'
+
+## The format of a binary record: motor number, time and position
+BINARY_FORMAT = '<BLl'
+
+# Where the time and position fields start in a text line, and their widths
+_TIME_START = 2
+_TIME_DIGITS = 10
+_POS_START = 13
+_POS_DIGITS = 9
+
+_ZERO = ord('0')
+_MINUS = ord('-')
+
+
+@micropython.native
+def _put_digits(buf, start, value, digits):
+    '''!
+    @brief      Write a non-negative integer into a buffer as zero-padded decimal digits.
+    @details    Only the lowest @c digits digits of the value are written.
+    @param      buf The bytearray into which the digits are written
+    @param      start The index in @c buf of the first digit
+    @param      value The integer to be written
+    @param      digits The number of digits to write
+    @return     None
+    '''
+    idx = start + digits - 1
+    while idx >= start:
+        buf[idx] = _ZERO + value % 10
+        value //= 10
+        idx -= 1
+
+
+class TelemetryBuffer(task_share.BaseShare):
+    '''!
+    @brief      Collects samples of motor number, time and position and sends them in one write.
+    @details    Control tasks call @c add() each time they have a new sample, and a low priority task
+                calls @c send() to write every sample collected since the last send to a UART. The
+                memory for the samples, and a memoryview of every length the batch can have, are
+                made when the buffer is created, so neither method allocates memory. Samples added
+                when the buffer is full are dropped and counted. As the buffer isn't protected
+                against interrupts, @c add() must be called from tasks, not from interrupt service
+                routines; a @c task_share.SPSCQueue should be used to pass samples out of an ISR.
+    '''
+
+    def __init__(self, lines=64, binary=False, name=None):
+        '''!
+        @brief      Create a telemetry buffer.
+        @param      self The object itself
+        @param      lines The number of samples the buffer can hold between sends
+        @param      binary @c True to pack samples as binary records in @c BINARY_FORMAT rather than
+                    as lines of text
+        @param      name A short name for the buffer, used in diagnostic printouts
+        '''
+        super().__init__('B', False, name)
+        self._name = str(name) if name is not None else 'Telemetry'
+        self.binary = binary
+        ## The number of bytes used by each sample
+        self.line_size = struct.calcsize(BINARY_FORMAT) if binary else len(ASCII_LINE)
+        self._lines = lines
+        self._buf = bytearray(ASCII_LINE * lines) if not binary \
+            else bytearray(self.line_size * lines)
+        view = memoryview(self._buf)
+        self._views = [view[:count * self.line_size] for count in range(lines + 1)]
+        self._count = 0
+        ## The number of samples dropped because the buffer was full
+        self.dropped = 0
+        gc.collect()
+
+    @micropython.native
+    def add(self, motor, time, position):
+        '''!
+        @brief      Add a sample to the buffer.
+        @details    In text lines the motor number has one digit, the time ten and the position nine
+                    digits and a sign; higher digits are cut off.
+        @param      self The object itself
+        @param      motor The number of the motor, 0 to 9
+        @param      time The time of the sample, a non-negative integer
+        @param      position The position of the motor in encoder counts
+        @return     @c True if the sample was added, @c False if it was dropped as the buffer is full
+        '''
+        count = self._count
+        if count >= self._lines:
+            self.dropped += 1
+            self._n_dropped += 1
+            return False
+
+        buf = self._buf
+        start = count * self.line_size
+        if self.binary:
+            struct.pack_into(BINARY_FORMAT, buf, start, motor, time, position)
+        else:
+            buf[start] = _ZERO + motor % 10
+            _put_digits(buf, start + _TIME_START, time, _TIME_DIGITS)
+            if position < 0:
+                buf[start + _POS_START] = _MINUS
+                position = -position
+            else:
+                buf[start + _POS_START] = _ZERO
+            _put_digits(buf, start + _POS_START + 1, position, _POS_DIGITS)
+
+        self._count = count + 1
+        self._n_put += 1
+        if self._waiters:
+            self._wake()
+        return True
+
+    def send(self, stream):
+        '''!
+        @brief      Write every sample in the buffer to a stream in one write and empty the buffer.
+        @param      self The object itself
+        @param      stream An object with a @c write() method, such as a @c pyb.UART
+        @return     The number of samples sent
+        '''
+        count = self._count
+        if count:
+            stream.write(self._views[count])
+            self._count = 0
+            self._n_got += count
+        return count
+
+    def view(self):
+        '''!
+        @brief      Get the samples in the buffer without removing them.
+        @param      self The object itself
+        @return     A memoryview of the bytes of the samples, which changes as samples are added
+        '''
+        return self._views[self._count]
+
+    def any(self):
+        '''!
+        @brief      Check if there are any samples in the buffer.
+        @param      self The object itself
+        @return     @c True if the buffer holds samples waiting to be sent
+        '''
+        return self._count > 0
+
+    def num_in(self):
+        '''!
+        @brief      Get the number of samples in the buffer.
+        @param      self The object itself
+        @return     The number of samples waiting to be sent
+        '''
+        return self._count
+
+    def full(self):
+        '''!
+        @brief      Check if the buffer is full.
+        @param      self The object itself
+        @return     @c True if no more samples can be added until the buffer is sent or cleared
+        '''
+        return self._count >= self._lines
+
+    def clear(self):
+        '''!
+        @brief      Throw away every sample in the buffer.
+        @param      self The object itself
+        @return     None
+        '''
+        self._count = 0
+
+    def __repr__(self):
+        '''!
+        @brief      Put diagnostic information about the buffer into a string.
+        @param      self The object itself
+        @return     A string holding the buffer's name, kind, size and statistics
+        '''
+        return ('{:<12s} Telemetry<{:s}> {:d}/{:d}'
+                .format(self._name, 'binary' if self.binary else 'text',
+                        self._count, self._lines)
+                + self._stats_str())
+
+
+def heap_growth(step, cycles=100):
+    '''!
+    @brief      Measure the heap memory allocated by calling a function a number of times.
+    @details    The garbage collector is turned off while the function runs, so that memory which was
+                allocated and then collected is still counted. This needs @c gc.mem_alloc(), which
+                only MicroPython has.
+    @param      step The function to be called, with no arguments
+    @param      cycles The number of times to call it
+    @return     The number of bytes of heap memory which were allocated
+    '''
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.mem_alloc()
+        for _ in range(cycles):
+            step()
+        after = gc.mem_alloc()
+    finally:
+        gc.enable()
+    return after - before
+
+
+def check_control_cycles(controller, cycles=100, motor=1, buffer=None, stream=None):
+    '''!
+    @brief      Check that control cycles and their telemetry allocate no heap memory.
+    @details    Each cycle waits until the controller has run and adds its samples to a telemetry
+                buffer, as the control task does, sending the samples to the stream or throwing them
+                away whenever the buffer is full. The controller may be a @c ControllerBank, whose
+                elapsed time and position of each axis are added with motor numbers counting from 1,
+                or a single controller, whose @c motor_data is added. This is run on the board from
+                the REPL; the controller drives its motors while the check runs. An
+                @c AssertionError is raised if the heap grew. On the Pyboard each float result is a
+                new object on the heap, so a controller must do its per-cycle work with integers to
+                pass.
+    @param      controller The controller bank or controller to be checked
+    @param      cycles The number of control cycles to run
+    @param      motor The motor number put into the samples of a single controller
+    @param      buffer The telemetry buffer to use, or @c None to make one for the check
+    @param      stream The stream to which samples are sent, or @c None to throw them away
+    @return     The number of bytes the heap grew, which is zero when the check passes
+    '''
+    if buffer is None:
+        buffer = TelemetryBuffer()
+
+    def make_room():
+        if buffer.full():
+            if stream is not None:
+                buffer.send(stream)
+            else:
+                buffer.clear()
+
+    if hasattr(controller, 'positions'):
+        positions = controller.positions
+        count = controller.count
+
+        def step():
+            while not controller.run():
+                pass
+            for axis in range(count):
+                make_room()
+                buffer.add(axis + 1, controller.elapsed, positions[axis])
+    else:
+        data = controller.motor_data
+
+        def step():
+            while not controller.run():
+                pass
+            make_room()
+            buffer.add(motor, data[0], data[1])
+
+    # Run once first so that anything made on the first run isn't counted
+    step()
+    growth = heap_growth(step, cycles)
+    assert growth == 0, 'heap grew by {:d} bytes in {:d} control cycles'.format(growth, cycles)
+    return growth
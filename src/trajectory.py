@@ -0,0 +1,165 @@
+"""!
+@file trajectory.py
+    This file contains functions which compute motion profiles ahead of time and store them as tables
+    of setpoints, one for each run of a controller. A controller following a profile looks up its next
+    setpoint in the table each run rather than jumping straight to the target, so the motor isn't
+    driven into saturation by a step and the response doesn't depend on the control period; all of
+    the trajectory math is done before the move starts, none of it in the control loop.
+
+    Trapezoidal profiles accelerate at a constant rate up to a top speed, cruise, and slow down at the
+    same rate. S-curve profiles are trapezoidal profiles smoothed by a moving average, which makes the
+    acceleration ramp up and down rather than jump, at the cost of a slightly longer move. Coordinated
+    profiles move several axes so that they all start and finish together.
+
+    Example of moving two axes of a controller bank together:
+    @code
+        import trajectory
+
+        profiles = trajectory.coordinated([8000, -2000], v_max=4000, a_max=8000, period=10)
+        bank.move(profiles)
+    @endcode
+
+    Each point of a table takes four bytes, so a profile of T seconds at a period of P milliseconds
+    takes 4000 * T / P bytes for each axis.
+
+@author Ben Elkayam
+@author Roey Mevorach
+@author Ermias Yemane
+
+@date   2026-Oct-17
+"""
+"""!
+@package array              Contains the array type in which the profiles are stored.
+@package math               Contains the square root used to find the top speed of short moves.
+"""
+import array
+import math
+
+
+def _trapezoid(distance, v_max, a_max, period):
+    '''!
+    @brief      Compute the positions of a trapezoidal move at each control period.
+    @param      distance The length of the move, which must not be negative
+    @param      v_max The top speed in encoder counts per second
+    @param      a_max The acceleration and deceleration in encoder counts per second squared
+    @param      period The time between setpoints in milliseconds
+    @return     A list of positions, the last of which is @c distance
+    '''
+    if distance <= 0:
+        return [0.0]
+
+    # Moves too short to reach the top speed have a triangular speed profile
+    t_acc = v_max / a_max
+    if a_max * t_acc * t_acc > distance:
+        t_acc = math.sqrt(distance / a_max)
+    v_peak = a_max * t_acc
+    t_flat = (distance - v_peak * t_acc) / v_peak
+    t_total = 2 * t_acc + t_flat
+
+    step = period / 1000
+    count = max(1, math.ceil(t_total / step))
+    points = []
+    for num in range(1, count + 1):
+        t = num * step
+        if t < t_acc:
+            pos = 0.5 * a_max * t * t
+        elif t < t_acc + t_flat:
+            pos = 0.5 * v_peak * t_acc + v_peak * (t - t_acc)
+        elif t < t_total:
+            left = t_total - t
+            pos = distance - 0.5 * a_max * left * left
+        else:
+            pos = distance
+        points.append(pos)
+    return points
+
+
+def _smooth(points, window):
+    '''!
+    @brief      Smooth a list of positions with a moving average.
+    @details    Positions before the start are taken to be zero and positions after the end are taken to be
+                the last position, so the smoothed list is @c window - 1 points longer and still ends at the
+                last position.
+    @param      points The list of positions
+    @param      window The number of positions averaged
+    @return     The smoothed list of positions
+    '''
+    if window <= 1:
+        return points
+    last = points[-1]
+    smoothed = []
+    total = 0.0
+    for num in range(len(points) + window - 1):
+        total += points[num] if num < len(points) else last
+        if num >= window:
+            total -= points[num - window] if num - window < len(points) else last
+        smoothed.append(total / window)
+    smoothed[-1] = last
+    return smoothed
+
+
+def _table(points, scale):
+    '''!
+    @brief      Scale a list of positions and store it as a table of integers.
+    @param      points The list of positions
+    @param      scale The number by which each position is multiplied
+    @return     An array of signed integer positions
+    '''
+    return array.array('l', (int(round(pos * scale)) for pos in points))
+
+
+def trapezoid(distance, v_max, a_max, period=10):
+    '''!
+    @brief      Compute a trapezoidal motion profile.
+    @param      distance The length of the move in encoder counts, negative to move backwards
+    @param      v_max The top speed in encoder counts per second
+    @param      a_max The acceleration and deceleration in encoder counts per second squared
+    @param      period The time between setpoints in milliseconds, which should be the time between runs of
+                the controller which follows the profile
+    @return     An array of positions relative to the start of the move, one for each period
+    '''
+    return _table(_trapezoid(abs(distance), v_max, a_max, period), -1 if distance < 0 else 1)
+
+
+def s_curve(distance, v_max, a_max, period=10, jerk_time=None):
+    '''!
+    @brief      Compute an S-curve motion profile.
+    @details    The profile is a trapezoidal profile smoothed by a moving average lasting @c jerk_time, over
+                which the acceleration ramps between zero and @c a_max; the move takes @c jerk_time longer
+                than the trapezoidal one.
+    @param      distance The length of the move in encoder counts, negative to move backwards
+    @param      v_max The top speed in encoder counts per second
+    @param      a_max The largest acceleration in encoder counts per second squared
+    @param      period The time between setpoints in milliseconds
+    @param      jerk_time The time in seconds taken to ramp the acceleration up or down, or @c None to use the
+                time taken to reach the top speed
+    @return     An array of positions relative to the start of the move, one for each period
+    '''
+    if jerk_time is None:
+        jerk_time = v_max / a_max
+    window = max(1, int(round(jerk_time * 1000 / period)))
+    points = _smooth(_trapezoid(abs(distance), v_max, a_max, period), window)
+    return _table(points, -1 if distance < 0 else 1)
+
+
+def coordinated(distances, v_max, a_max, period=10, jerk_time=0):
+    '''!
+    @brief      Compute profiles which move several axes so that they start and finish together.
+    @details    The profile of the axis with the longest move is computed with the given speed and
+                acceleration limits, and every other axis follows the same profile scaled to its own
+                distance, so the shorter moves are made more slowly and all the axes arrive at once.
+    @param      distances A list of the lengths of the moves in encoder counts, one for each axis
+    @param      v_max The top speed of the longest move in encoder counts per second
+    @param      a_max The acceleration of the longest move in encoder counts per second squared
+    @param      period The time between setpoints in milliseconds
+    @param      jerk_time The time in seconds to ramp the acceleration up or down for S-curve profiles, or 0
+                for trapezoidal profiles
+    @return     A list of arrays of positions relative to the start of each axis's move, all the same length
+    '''
+    longest = max(abs(distance) for distance in distances)
+    if longest == 0:
+        return [array.array('l', [0]) for _ in distances]
+    points = _trapezoid(longest, v_max, a_max, period)
+    if jerk_time > 0:
+        points = _smooth(points, max(1, int(round(jerk_time * 1000 / period))))
+    return [_table(points, distance / longest) for distance in distances]